@@ -0,0 +1,248 @@
+import asyncio
+import copy
+import json
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.core.connector import get_logger, ConnectorError
+
+from .horizon_api_auth import DEFAULT_POOL_SIZE, RETRYABLE_STATUS_CODES, HorizonAPI, SingleFlight, safe_number
+from .metrics import graphql_operation_name, metrics
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = get_logger('horizon-ai')
+
+DEFAULT_ASYNC_CONCURRENCY = 64
+
+# One connection pool per event loop and configuration
+_sessions = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+# Identical requests in flight per event loop, as key -> [task, followers]
+_inflight = weakref.WeakKeyDictionary()
+_fallback_logged = False
+
+
+def async_available():
+    """Whether requests can be made without a thread per request (aiohttp is installed)"""
+    return aiohttp is not None
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code, also when called inside a running loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+class AsyncHorizonAPI:
+    """
+    asyncio counterpart of HorizonAPI, sharing its retry delays, GraphQL error handling,
+    data unwrapping and response metrics.
+
+    Requests go through aiohttp with one pooled session per event loop, and use the
+    process-wide token cache and rate limiter of the configuration; at most
+    max_concurrency requests of this client are in flight at once, and identical
+    requests in flight on the same loop share one upstream call. Without aiohttp the
+    blocking HorizonAPI calls run on a thread pool of that size instead, which is
+    logged once and reported by transport.
+    """
+
+    def __init__(self, config, max_concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        global _fallback_logged
+        self.api = HorizonAPI(config)
+        self.pool_size = safe_number(config.get('pool_size'), DEFAULT_POOL_SIZE, int)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.transport = 'aiohttp' if async_available() else 'threads'
+        self._semaphore = None
+        self._executor = None
+        if not async_available() and not _fallback_logged:
+            _fallback_logged = True
+            logger.warning("aiohttp is not installed, async requests run on a thread pool")
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        with _sessions_lock:
+            sessions = _sessions.setdefault(loop, {})
+            session = sessions.get(self.api._token_key)
+            if session is None or session.closed:
+                options = {} if self.api.verify_ssl else {'ssl': False}
+                connector = aiohttp.TCPConnector(limit=max(self.pool_size, self.max_concurrency), **options)
+                session = sessions[self.api._token_key] = aiohttp.ClientSession(
+                    connector=connector, timeout=aiohttp.ClientTimeout(total=self.api.timeout))
+            return session
+
+    def _bounded(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _in_thread(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='horizon-async')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _auth_headers(self, graphql_operation):
+        # the cached token is normally returned at once; fetching a new one blocks, so it runs in a thread
+        return await asyncio.get_running_loop().run_in_executor(None, self.api._auth_headers, graphql_operation)
+
+    async def _acquire(self):
+        started = time.monotonic()
+        while True:
+            delay = self.api.limiter.try_acquire()
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        waited = time.monotonic() - started
+        self.api.limiter.record_wait(waited)
+
+    async def _post(self, headers, body, stats):
+        """
+        POST with the bounded retries of HorizonAPI._post; returns the status, the body
+        bytes and the seconds until the response headers arrived.
+        """
+        url = f"{self.api.base_url}/v1/graphql"
+        attempt = 0
+        while True:
+            await self._acquire()
+            throttled = True
+            try:
+                sent = time.perf_counter()
+                async with self._session().post(url, headers=headers, data=body) as response:
+                    ttfb = time.perf_counter() - sent
+                    content = await response.read()
+                    status, response_headers = response.status, response.headers
+                throttled = status in RETRYABLE_STATUS_CODES
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                self.api.limiter.release(throttled)
+                delay = self.api._retry_delay(url, attempt, error=e)
+                if delay is None:
+                    raise
+            except Exception:
+                self.api.limiter.release(throttled)
+                raise
+            else:
+                self.api.limiter.release(throttled)
+                delay = self.api._retry_delay(url, attempt, status, response_headers)
+                if delay is None:
+                    return status, content, ttfb
+            attempt += 1
+            stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    async def make_request_async(self, query, variables=None, allow_errors=False):
+        """
+        Awaitable HorizonAPI.make_request. Identical requests in flight on the same loop
+        share one upstream call; each caller gets its own copy of the result.
+        """
+        key = SingleFlight.make_key(query, variables, allow_errors, self.api._token_key)
+        calls = _inflight.setdefault(asyncio.get_running_loop(), {})
+        call = calls.get(key)
+        if call is not None:
+            call[1] += 1
+            metrics.increment('coalesced_requests')
+            return copy.deepcopy(await asyncio.shield(call[0]))
+
+        call = calls[key] = [asyncio.ensure_future(self._bounded_request(query, variables, allow_errors)), 0]
+        try:
+            # shielded so a cancelled leader does not cancel the call for the callers sharing it
+            result = await asyncio.shield(call[0])
+        finally:
+            if calls.get(key) is call:
+                del calls[key]
+        # callers may modify the result, so a shared one is never handed out as is
+        return copy.deepcopy(result) if call[1] else result
+
+    async def _bounded_request(self, query, variables, allow_errors):
+        async with self._bounded():
+            if aiohttp is None:
+                return await self._in_thread(self.api.make_request, query, variables, allow_errors)
+            return await self._request(query, variables, allow_errors)
+
+    async def _request(self, query, variables, allow_errors):
+        graphql_operation = graphql_operation_name(query)
+        started = time.perf_counter()
+        stats = {'retries': 0}
+        try:
+            payload = {
+                'query': query
+            }
+            if variables:
+                payload['variables'] = variables
+            body = json.dumps(payload).encode('utf-8')
+
+            # A rejected token is refreshed and the request retried exactly once
+            for auth_attempt in range(2):
+                headers = await self._auth_headers(graphql_operation)
+                status, content, ttfb = await self._post(headers, body, stats)
+
+                if status == 200:
+                    decode_started = time.perf_counter()
+                    data = json.loads(content)
+                    self.api._observe_response(graphql_operation, ttfb, len(body), len(content),
+                                               time.perf_counter() - decode_started)
+                    self.api._profile(graphql_operation, data, len(content))
+                    if self.api._check_errors(data, auth_attempt == 0, allow_errors):
+                        continue
+                    return self.api._unpack(data, allow_errors)
+                elif status == 401 and auth_attempt == 0:
+                    self.api._invalidate_token()
+                    continue
+                raise ConnectorError(f"HTTP Error: {status} - {content.decode('utf-8', 'replace')}")
+
+        except Exception as e:
+            logger.error(f"Error making request: {str(e)}")
+            metrics.increment('errors')
+            raise ConnectorError(str(e))
+        finally:
+            metrics.observe(graphql_operation, 'latency_seconds', time.perf_counter() - started)
+            metrics.observe(graphql_operation, 'retries', stats['retries'])
+
+    async def paginate_async(self, query, variables, page_key, records_key, max_records=None):
+        """Async generator over the records of a paged query, with the paging rules of HorizonAPI.paginate"""
+        page_input = dict(variables.get('page_input') or {})
+        page_size = page_input.get('page_size') or 50
+        page_num = page_input.get('page_num') or 1
+        last_cursor = None
+        yielded = 0
+        while True:
+            page_input['page_num'] = page_num
+            result = await self.make_request_async(query, dict(variables, page_input=dict(page_input)))
+            page = (result or {}).get(page_key) or {}
+            records = page.get(records_key) or []
+            for record in records:
+                yield record
+                yielded += 1
+                if max_records and yielded >= max_records:
+                    return
+            page_info = page.get('page_info') or {}
+            cursor = page_info.get('end_cursor')
+            served = page_info.get('page_size')
+            if served and served < page_size:
+                # the server caps the page size and numbers its pages by the size it served
+                page_size = served
+            if len(records) < page_size or (cursor and cursor == last_cursor):
+                return
+            last_cursor = cursor
+            page_num += 1
+
+    async def aclose(self):
+        """Close this configuration's session on the running loop and the fallback thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if aiohttp is None:
+            return
+        loop = asyncio.get_running_loop()
+        with _sessions_lock:
+            session = (_sessions.get(loop) or {}).pop(self.api._token_key, None)
+        if session is not None:
+            await session.close()
@@ -0,0 +1,107 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from connectors.core.connector import get_logger, ConnectorError
+
+from .horizon_api_auth import HorizonAPI
+from .queries import ENTITIES, SUBSELECTIONS, _selection
+
+logger = get_logger('horizon-ai')
+
+# Estimated number of values (records x fields) a single batched document may request
+DEFAULT_MAX_BATCH_COST = 20000
+MAX_BATCH_SIZE = 50
+
+
+def query_cost(fields, page_size):
+    """Estimated complexity of one per-op sub-query: records times selected leaf fields"""
+    return max(page_size, 1) * sum(len(SUBSELECTIONS.get(field, ())) or 1 for field in fields)
+
+
+def plan_batches(op_ids, cost, max_cost=DEFAULT_MAX_BATCH_COST, max_size=MAX_BATCH_SIZE):
+    """Split op_ids into batches whose combined cost stays within max_cost"""
+    per_batch = max(1, min(max_size, max_cost // max(cost, 1)))
+    return [op_ids[i:i + per_batch] for i in range(0, len(op_ids), per_batch)]
+
+
+@lru_cache(maxsize=128)
+def batch_query(entity, fields, count):
+    """Build one GraphQL document querying the page of count ops under the aliases op_0..op_N"""
+    page_key = ENTITIES[entity]['page_key']
+    definitions = ', '.join(f"$input_{i}: OpInput!, $page_input_{i}: PageInput" for i in range(count))
+    selection = _selection(fields, 20)
+    roots = '\n'.join(f"""            op_{i}: {page_key}(input: $input_{i}, page_input: $page_input_{i}) {{
+                {entity} {{
+{selection}
+                }}
+                page_info {{
+                    page_size
+                    end_cursor
+                }}
+            }}""" for i in range(count))
+    return f"""
+        query {page_key}_batch({definitions}) {{
+{roots}
+        }}
+        """
+
+
+def run_batch(horizon, entity, fields, op_ids, page_input):
+    """
+    Query the first page of several ops in one request and split the response per op.
+
+    Returns a dict of op_id to either the op's result ({page_key: {...}}) or the
+    ConnectorError for that op. Errors are attributed to an op through the alias at the
+    start of their path; errors without a path fail the whole batch.
+    """
+    page_key = ENTITIES[entity]['page_key']
+    variables = {}
+    for i, op_id in enumerate(op_ids):
+        variables[f"input_{i}"] = {"op_id": op_id}
+        variables[f"page_input_{i}"] = page_input
+    body = horizon.make_request(batch_query(entity, fields, len(op_ids)), variables, allow_errors=True)
+    data = body.get('data') or {}
+
+    alias_errors = {}
+    batch_errors = []
+    for error in body.get('errors') or []:
+        path = error.get('path') if isinstance(error, dict) else None
+        if path:
+            alias_errors.setdefault(path[0], []).append(error)
+        else:
+            batch_errors.append(error)
+
+    results = {}
+    for i, op_id in enumerate(op_ids):
+        alias = f"op_{i}"
+        errors = alias_errors.get(alias, []) + batch_errors
+        if errors:
+            results[op_id] = ConnectorError(f"GraphQL Error: {errors}")
+        elif data.get(alias) is None:
+            results[op_id] = ConnectorError("GraphQL Error: no data returned")
+        else:
+            results[op_id] = {page_key: data[alias]}
+    return results
+
+
+def batch_op_pages(config, entity, fields, op_ids, page_input, max_workers=1, max_cost=DEFAULT_MAX_BATCH_COST):
+    """
+    Fetch one page for every op_id using as few requests as the cost limit allows.
+    Batches run concurrently on up to max_workers threads. Returns op_id to result or error.
+    """
+    batches = plan_batches(op_ids, query_cost(fields, page_input.get('page_size') or 50), max_cost)
+
+    def fetch(batch):
+        try:
+            return run_batch(HorizonAPI(config), entity, fields, batch, page_input)
+        except Exception as e:
+            logger.error(f"Error running batched {ENTITIES[entity]['page_key']} query: {str(e)}")
+            return {op_id: e for op_id in batch}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fetch, batch) for batch in batches]
+    results = {}
+    for future in futures:
+        results.update(future.result())
+    return results
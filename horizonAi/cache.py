@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from connectors.core.connector import get_logger
+
+logger = get_logger('horizon-ai')
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Results of ops that finished post-processing long ago do not change any more
+COMPLETED_TTL = 24 * 3600
+# Ops that finished recently may still be touched by late post-processing
+RECENT_TTL = 300
+RECENT_WINDOW = 3600
+# Ops that are still running change constantly
+RUNNING_TTL = 30
+
+
+def cache_key(*parts):
+    """Stable hash of the JSON-serialisable parts identifying a cached response"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp from the API into an aware datetime, or None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def ttl_for_completion(etl_completed_at):
+    """Cache lifetime for the results of an op, based on when its post-processing finished"""
+    completed = parse_timestamp(etl_completed_at)
+    if completed is None:
+        return RUNNING_TTL
+    if (datetime.now(timezone.utc) - completed).total_seconds() < RECENT_WINDOW:
+        return RECENT_TTL
+    return COMPLETED_TTL
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of API results with per-entry TTLs, bounded both by entry
+    count and by the total size of the entries' JSON encoding. An entry larger than
+    the whole byte budget is not kept in memory (it is still persisted when a
+    directory is given).
+
+    Entries can optionally be persisted as JSON files in a directory, which is consulted
+    on a memory miss so cached results survive connector restarts. Entries can be tagged
+    with a group (e.g. a configuration) so they can be dropped together.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._key_groups = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, disk_dir=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._drop(key)
+        if disk_dir:
+            entry = self._load(disk_dir, key)
+            if entry is not None and entry[0] > now:
+                with self._lock:
+                    self._store(key, entry)
+                    self.disk_hits += 1
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, ttl, disk_dir=None, group=None):
+        encoded = json.dumps(value)
+        entry = (time.time() + ttl, value, len(encoded))
+        with self._lock:
+            if self._store(key, entry) and group is not None:
+                self._key_groups[key] = group
+                self._groups.setdefault(group, set()).add(key)
+        if disk_dir:
+            self._save(disk_dir, key, entry[0], encoded)
+
+    def _store(self, key, entry):
+        """Keep an entry in memory unless it exceeds the byte budget; returns whether it was kept"""
+        if key in self._entries:
+            self._drop(key)
+        if entry[2] > self.max_bytes:
+            return False
+        self._entries[key] = entry
+        self.bytes += entry[2]
+        self._evict()
+        return True
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._drop(key)
+            self.evictions += 1
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+        self._forget(key)
+
+    def _forget(self, key):
+        group = self._key_groups.pop(key, None)
+        if group is not None:
+            keys = self._groups.get(group)
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+    def invalidate_group(self, group, disk_dir=None):
+        """Drop every entry set with the given group, in memory and on disk; returns the count"""
+        with self._lock:
+            keys = self._groups.pop(group, set())
+            for key in keys:
+                self._key_groups.pop(key, None)
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[2]
+        if disk_dir:
+            for key in keys:
+                try:
+                    os.remove(os.path.join(disk_dir, f"{key}.json"))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove cache entry {key}: {str(e)}")
+        return len(keys)
+
+    @staticmethod
+    def _load(disk_dir, key):
+        path = os.path.join(disk_dir, f"{key}.json")
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            return data['expires_at'], data['value'], os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _save(disk_dir, key, expires_at, encoded):
+        try:
+            os.makedirs(disk_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=disk_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{{"expires_at": {json.dumps(expires_at)}, "value": {encoded}}}')
+            os.replace(tmp_path, os.path.join(disk_dir, f"{key}.json"))
+        except OSError as e:
+            logger.warning(f"Could not persist cache entry {key}: {str(e)}")
+
+    def resize(self, max_entries, max_bytes=None):
+        with self._lock:
+            self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self, disk_dir=None):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self._groups.clear()
+            self._key_groups.clear()
+        if disk_dir and os.path.isdir(disk_dir):
+            for name in os.listdir(disk_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(disk_dir, name))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+response_cache = ResponseCache()
@@ -1,20 +1,49 @@
+import threading
+
 from connectors.core.connector import Connector, get_logger, ConnectorError
 
-from .operations import operations, health_check
+from .metrics import operation_context
+from .operations import operations, health_check, release_all, release_config, warm_up
 
 logger = get_logger("horizonAi")
 
 
+def _configs(config):
+    """Lifecycle hooks get either one configuration or all of them keyed by config id"""
+    if not config:
+        return []
+    if 'server_url' in config or 'api_token' in config:
+        return [config]
+    return [value for value in config.values() if isinstance(value, dict)]
+
+
+def _warm_up(config):
+    try:
+        count = warm_up(config)
+        logger.info(f"Warmed up connection to {config.get('server_url')}, prefetched {count} pentests")
+    except Exception as err:
+        logger.warning(f"Warm-up failed, the first operation will authenticate instead: {str(err)}")
+
+
+def warm_up_async(config):
+    """Warm up every configuration in the background so the hooks never block on the API"""
+    for item in _configs(config):
+        if item.get('warm_up', True):
+            threading.Thread(target=_warm_up, args=(item,), name='horizon-warm-up', daemon=True).start()
+
+
 class CustomConnector(Connector):
     def execute(self, config, operation, params, **kwargs):
         try:
             config['connector_info'] = {"connector_name": self._info_json.get('name'),
                                         "connector_version": self._info_json.get('version')}
+            operation_name = operation
             operation = operations.get(operation)
             if not operation:
-                logger.error('Unsupported operation: {}'.format(operation))
+                logger.error('Unsupported operation: {}'.format(operation_name))
                 raise ConnectorError('Unsupported operation')
-            return operation(config, params)
+            with operation_context(operation_name):
+                return operation(config, params)
         except Exception as err:
             logger.exception(err)
             raise ConnectorError(err)
@@ -28,22 +57,29 @@ class CustomConnector(Connector):
             raise ConnectorError(err)
 
     def on_app_start(self, config, active):
-        pass
+        if active:
+            warm_up_async(config)
 
     def on_add_config(self, config, active):
-        pass
+        if active:
+            warm_up_async(config)
 
     def on_update_config(self, old_config, new_config, active):
-        pass
+        for item in _configs(old_config):
+            release_config(item)
+        if active:
+            warm_up_async(new_config)
 
     def on_delete_config(self, config):
-        pass
+        for item in _configs(config):
+            release_config(item)
 
     def on_activate(self, config):
-        pass
+        warm_up_async(config)
 
     def on_deactivate(self, config):
-        pass
+        for item in _configs(config):
+            release_config(item)
 
     def teardown(self, config):
-        pass
+        release_all()
@@ -0,0 +1,76 @@
+from collections import deque
+
+DEFAULT_MAX_FINDINGS = 1000
+
+# Fields identifying the same finding in two pentests of an environment
+FINGERPRINTS = {
+    'weaknesses': ('vuln_id', 'ip', 'affected_asset_text'),
+    'attack_paths': ('impact_type', 'ip', 'affected_asset_text'),
+}
+
+# Fields reported with each finding besides its fingerprint
+DETAILS = {
+    'weaknesses': ('uuid', 'vuln_name', 'severity', 'score'),
+    'attack_paths': ('uuid', 'name', 'severity', 'score'),
+}
+
+DIFF_FIELDS = {entity: FINGERPRINTS[entity] + DETAILS[entity] for entity in FINGERPRINTS}
+
+
+def fingerprint(entity, record):
+    return tuple(record.get(field) for field in FINGERPRINTS[entity])
+
+
+def diff_findings(entity, baseline, retest, max_findings=DEFAULT_MAX_FINDINGS):
+    """
+    Compare the findings of two pentests by fingerprint with a hash join.
+
+    The baseline records are consumed first into an index holding only the fingerprint
+    and detail values of each record; the retest records are then matched against it
+    one at a time, so neither side is kept as full records. Findings sharing a
+    fingerprint are paired one to one. At most max_findings findings are listed per
+    outcome, the counts always cover all of them.
+    """
+    keys = FINGERPRINTS[entity]
+    details = DETAILS[entity]
+    index = {}
+    baseline_count = 0
+    for record in baseline:
+        baseline_count += 1
+        index.setdefault(fingerprint(entity, record), deque()).append(
+            tuple(record.get(field) for field in details))
+
+    listed = {"new": [], "fixed": [], "persisting": []}
+    counts = dict.fromkeys(listed, 0)
+
+    def report(outcome, key, detail, baseline_detail=None):
+        counts[outcome] += 1
+        if max_findings and len(listed[outcome]) >= max_findings:
+            return
+        finding = dict(zip(keys, key))
+        finding.update(zip(details, detail))
+        if baseline_detail is not None:
+            finding['baseline_uuid'] = baseline_detail[0]
+            finding['baseline_severity'] = baseline_detail[2]
+        listed[outcome].append(finding)
+
+    retest_count = 0
+    for record in retest:
+        retest_count += 1
+        key = fingerprint(entity, record)
+        detail = tuple(record.get(field) for field in details)
+        matches = index.get(key)
+        if matches:
+            report('persisting', key, detail, matches.popleft())
+        else:
+            report('new', key, detail)
+    for key, remaining in index.items():
+        for detail in remaining:
+            report('fixed', key, detail)
+
+    result = {"baseline_count": baseline_count, "retest_count": retest_count}
+    for outcome, findings in listed.items():
+        result[f"{outcome}_count"] = counts[outcome]
+        result[outcome] = findings
+    result['truncated'] = any(counts[outcome] > len(findings) for outcome, findings in listed.items())
+    return result
@@ -0,0 +1,111 @@
+import gzip
+import json
+import os
+import time
+
+from connectors.core.connector import get_logger
+
+from .paging import DEFAULT_MAX_PAGE_SIZE
+from .state import load_state, save_state, state_dir
+
+logger = get_logger('horizon-ai')
+
+# the largest page size the API is known to serve in full
+DEFAULT_EXPORT_PAGE_SIZE = DEFAULT_MAX_PAGE_SIZE
+
+
+def export_dir(config):
+    """Directory export files are written to"""
+    path = config.get('export_dir') or os.path.join(state_dir(config), 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class NDJSONExport:
+    """
+    Gzip compressed NDJSON file written one page at a time, with a checkpoint after
+    every page so an interrupted export resumes where it stopped.
+
+    Each page is appended as its own gzip member (concatenated members are one valid
+    gzip stream), and the checkpoint records the file size after the page together
+    with the position to continue from. On resume the file is truncated back to the
+    checkpointed size, which drops a page that was only partially written.
+    """
+
+    def __init__(self, config, job, file_name, restart=False):
+        self.config = config
+        self.state_name = f"export-{job}"
+        self.path = os.path.join(export_dir(config), file_name)
+        checkpoint = None if restart else load_state(config, self.state_name)
+        self.resumed = self._usable(checkpoint)
+        if self.resumed:
+            self.checkpoint = checkpoint
+        else:
+            self.checkpoint = {
+                "file_path": self.path,
+                "records": 0,
+                "bytes": 0,
+                "pages": 0,
+                "position": None,
+                "complete": False,
+                "started_at": time.time()
+            }
+        self._file = None
+
+    def _usable(self, checkpoint):
+        if not checkpoint or checkpoint.get('file_path') != self.path:
+            return False
+        try:
+            return os.path.getsize(self.path) >= checkpoint['bytes']
+        except OSError:
+            return False
+
+    @property
+    def complete(self):
+        return self.checkpoint['complete']
+
+    @property
+    def position(self):
+        return self.checkpoint['position']
+
+    def open(self):
+        if self._file is None:
+            self._file = open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b')
+            self._file.truncate(self.checkpoint['bytes'])
+            self._file.seek(self.checkpoint['bytes'])
+        return self
+
+    def write_page(self, records, position):
+        """Append one page of records and checkpoint the position to continue from"""
+        self.open()
+        if records:
+            data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+            self._file.write(gzip.compress(data.encode('utf-8'), mtime=0))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self.checkpoint['records'] += len(records)
+        self.checkpoint['bytes'] = self._file.tell()
+        self.checkpoint['pages'] += 1
+        self.checkpoint['position'] = position
+        save_state(self.config, self.state_name, self.checkpoint)
+
+    def finish(self):
+        self.checkpoint['complete'] = True
+        self.checkpoint['finished_at'] = time.time()
+        save_state(self.config, self.state_name, self.checkpoint)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        return {
+            "file_path": self.path,
+            "file_name": os.path.basename(self.path),
+            "records": self.checkpoint['records'],
+            "bytes": self.checkpoint['bytes'],
+            "pages": self.checkpoint['pages'],
+            "complete": self.checkpoint['complete'],
+            "resumed": self.resumed
+        }
@@ -0,0 +1,189 @@
+from itertools import islice
+
+from .cache import cache_key
+
+# Structured filter parameters per entity: parameter -> (field, kind)
+#   values:    record field equals one of a comma separated list of values
+#   flag:      boolean field, "Yes" / "No" ("Any" or empty disables the filter)
+#   min / max: numeric lower / upper bound (inclusive)
+#   after / before: timestamp bound (exclusive)
+#   contains:  case-insensitive substring match
+FILTER_PARAMS = {
+    'weaknesses': {
+        'severity': ('severity', 'values'),
+        'vuln_category': ('vuln_category', 'values'),
+        'vuln_id': ('vuln_id', 'values'),
+        'ip': ('ip', 'values'),
+        'vuln_cisa_kev': ('vuln_cisa_kev', 'flag'),
+        'has_proof': ('has_proof', 'flag'),
+        'min_score': ('score', 'min'),
+        'created_after': ('created_at', 'after'),
+        'created_before': ('created_at', 'before'),
+        'asset': ('affected_asset_text', 'contains'),
+    },
+    'attack_paths': {
+        'severity': ('severity', 'values'),
+        'impact_type': ('impact_type', 'values'),
+        'ip': ('ip', 'values'),
+        'host_name': ('host_name', 'contains'),
+        'min_score': ('score', 'min'),
+        'created_after': ('created_at', 'after'),
+        'created_before': ('created_at', 'before'),
+    },
+}
+
+# Filters the API evaluates in filter_by_inputs, per entity: field -> supported kinds.
+# Everything else (booleans, numeric bounds, substring matches) is applied locally.
+PUSHDOWN = {
+    'weaknesses': {
+        'severity': {'values'},
+        'vuln_category': {'values'},
+        'vuln_id': {'values'},
+        'ip': {'values'},
+        'created_at': {'after', 'before'},
+    },
+    'attack_paths': {
+        'severity': {'values'},
+        'impact_type': {'values'},
+        'ip': {'values'},
+        'created_at': {'after', 'before'},
+    },
+}
+
+# Fields the API can order by, per entity; other order_by fields are sorted locally
+SORTABLE = {
+    'weaknesses': {'created_at', 'severity', 'score', 'vuln_id', 'ip', 'vuln_category'},
+    'attack_paths': {'created_at', 'severity', 'score', 'impact_type', 'ip'},
+}
+
+_FLAGS = {'yes': True, 'true': True, 'no': False, 'false': False}
+
+
+def _split(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _predicate(field, kind, value):
+    """Build a record predicate for one local filter"""
+    if kind == 'values':
+        wanted = {item.lower() for item in value}
+        return lambda record: str(record.get(field)).lower() in wanted
+    if kind == 'flag':
+        return lambda record: bool(record.get(field)) is value
+    if kind in ('min', 'max'):
+        def bound(record):
+            number = _number(record.get(field))
+            return number is not None and (number >= value if kind == 'min' else number <= value)
+        return bound
+    if kind == 'after':
+        return lambda record: record.get(field) is not None and str(record.get(field)) > value
+    if kind == 'before':
+        return lambda record: record.get(field) is not None and str(record.get(field)) < value
+    needle = value.lower()
+    return lambda record: needle in str(record.get(field) or '').lower()
+
+
+class FilterPlan:
+    """
+    Split of the structured filters of a request into what the API evaluates
+    (filter_by_inputs and order_by) and what is applied locally to the records.
+    """
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.server_filters = []
+        self.local_filters = []
+        self.order_by = None
+        self.local_order = None
+        self._predicates = []
+
+    @property
+    def fields(self):
+        """Record fields the local filters and local ordering need to be selected"""
+        fields = tuple(field for field, _, _ in self.local_filters)
+        if self.local_order:
+            fields += (self.local_order[0],)
+        return fields
+
+    @property
+    def is_local(self):
+        return bool(self._predicates or self.local_order)
+
+    def local_key(self):
+        """Identifies the local part of the plan, for cache keys"""
+        return cache_key(self.local_filters, self.local_order)
+
+    def matches(self, record):
+        return all(predicate(record) for predicate in self._predicates)
+
+    def apply(self, records, max_records=None):
+        """Filter an iterable of records lazily, stopping after max_records matches"""
+        if self._predicates:
+            records = (record for record in records if self.matches(record))
+        if max_records:
+            records = islice(records, max_records)
+        return records
+
+    def finish(self, records):
+        """Apply the local ordering to materialised records"""
+        if not self.local_order:
+            return records
+        field, descending = self.local_order
+        present = [record for record in records if record.get(field) is not None]
+        missing = [record for record in records if record.get(field) is None]
+        present.sort(key=lambda record: record.get(field), reverse=descending)
+        return present + missing
+
+
+def plan_filters(entity, params):
+    """Build the FilterPlan for the filter parameters of a get_weaknesses / get_attack_paths call"""
+    plan = FilterPlan(entity)
+    pushdown = PUSHDOWN.get(entity, {})
+    for name, (field, kind) in FILTER_PARAMS.get(entity, {}).items():
+        raw = params.get(name)
+        if raw is None or raw == '' or raw == []:
+            continue
+        if kind == 'values':
+            value = _split(raw)
+            if not value:
+                continue
+        elif kind == 'flag':
+            if isinstance(raw, bool):
+                value = raw
+            elif str(raw).strip().lower() in _FLAGS:
+                value = _FLAGS[str(raw).strip().lower()]
+            else:
+                continue
+        elif kind in ('min', 'max'):
+            value = _number(raw)
+            if value is None:
+                raise ValueError(f"{name} must be a number, got {raw!r}")
+        else:
+            value = str(raw)
+
+        if kind in pushdown.get(field, ()):
+            if kind == 'values':
+                plan.server_filters.append({"field_name": field, "values": value})
+            else:
+                plan.server_filters.append({"field_name": field,
+                                            "greater_than" if kind == 'after' else "less_than": value})
+        else:
+            plan.local_filters.append((field, kind, value))
+            plan._predicates.append(_predicate(field, kind, value))
+
+    order_by = params.get('order_by')
+    if order_by:
+        if order_by in SORTABLE.get(entity, ()):
+            plan.order_by = order_by
+        else:
+            plan.local_order = (order_by, str(params.get('sort_order', 'ASC')).upper() == 'DESC')
+    return plan
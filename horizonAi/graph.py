@@ -0,0 +1,70 @@
+REF_CHUNK_SIZE = 200
+
+# Reference fields of an attack path and the kind of node they point to
+REF_FIELDS = {
+    'weakness_refs': 'weaknesses',
+    'credential_refs': 'credentials',
+    'host_refs': 'hosts',
+}
+
+# Attack path fields the graph needs besides the caller's selection
+GRAPH_FIELDS = ('uuid', 'weakness_refs', 'credential_refs', 'host_refs', 'ip', 'host_name')
+
+HOST_FIELDS = ('ip', 'host_name')
+
+
+def chunked(ids, size=REF_CHUNK_SIZE):
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+class AttackPathGraph:
+    """
+    Attack paths of an op with the entities they reference, each stored once.
+
+    Paths are added as they are read and their references collected into an
+    ID -> entity index per node kind; the adjacency maps every path to the IDs it
+    references. Weaknesses are filled in afterwards with resolve(). Hosts and
+    credentials have no lookup query in the API, their nodes carry the ID and, for
+    hosts, the ip and host name of the paths that reference a single host.
+    """
+
+    def __init__(self):
+        self.attack_paths = {}
+        self.adjacency = {}
+        self.nodes = {kind: {} for kind in REF_FIELDS.values()}
+
+    def add_path(self, path):
+        refs = {kind: list(dict.fromkeys(path.get(field) or ())) for field, kind in REF_FIELDS.items()}
+        for kind, ids in refs.items():
+            index = self.nodes[kind]
+            for ref in ids:
+                if ref not in index:
+                    index[ref] = None if kind == 'weaknesses' else {"id": ref}
+        if len(refs['hosts']) == 1:
+            host = self.nodes['hosts'][refs['hosts'][0]]
+            host.update((field, path[field]) for field in HOST_FIELDS if path.get(field) and field not in host)
+        self.attack_paths[path['uuid']] = {field: value for field, value in path.items() if field not in REF_FIELDS}
+        self.adjacency[path['uuid']] = refs
+
+    def unresolved(self, kind='weaknesses'):
+        return [ref for ref, entity in self.nodes[kind].items() if entity is None]
+
+    def resolve(self, records, kind='weaknesses'):
+        index = self.nodes[kind]
+        for record in records:
+            if record.get('uuid') in index:
+                index[record['uuid']] = record
+
+    def to_dict(self):
+        missing = self.unresolved()
+        return {
+            "attack_paths": self.attack_paths,
+            "nodes": {kind: {ref: entity for ref, entity in index.items() if entity is not None}
+                      for kind, index in self.nodes.items()},
+            "adjacency": self.adjacency,
+            "unresolved": {"weaknesses": missing},
+            "counts": dict({kind: len(index) for kind, index in self.nodes.items()},
+                           attack_paths=len(self.attack_paths),
+                           edges=sum(len(ids) for refs in self.adjacency.values() for ids in refs.values()))
+        }
@@ -1,15 +1,366 @@
+import base64
+import copy
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
 from connectors.core.connector import get_logger, ConnectorError
 
+from .metrics import graphql_operation_name, metrics
+from .paging import DEFAULT_MAX_PAGE_SIZE, SIZE_ERROR, PageSizer
+from .profiler import DEFAULT_PROFILE_SAMPLE_RATE, payload_profiler
+from .streaming import RecordStreamParser
+from .throttle import DEFAULT_MAX_CONCURRENCY, DEFAULT_RATE_BURST, DEFAULT_RATE_LIMIT, get_limiter
+
 logger = get_logger('horizon-ai')
 
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+# Lifetime assumed for tokens whose exp claim cannot be read
+TOKEN_DEFAULT_TTL = 900
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Answers meaning a request was too large or too slow, returned at once by fail-fast requests
+SIZE_ERROR_STATUS_CODES = {413, 504}
+RETRYABLE_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError)
+
+
+class PageSizeError(ConnectorError):
+    """A page request failed in a way a smaller page_size may avoid"""
+
+
+def decode_jwt_exp(token):
+    """Return the exp claim of a JWT as epoch seconds, or None if it cannot be read"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except Exception:
+        return None
+
+
+class _TokenEntry:
+    __slots__ = ('token', 'expires_at', 'refresh_at', 'refreshing', 'condition')
+
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0.0
+        self.refresh_at = 0.0
+        self.refreshing = False
+        self.condition = threading.Condition()
+
+    def store(self, token):
+        now = time.time()
+        self.token = token
+        self.expires_at = decode_jwt_exp(token) or now + TOKEN_DEFAULT_TTL
+        lifetime = max(self.expires_at - now, 0)
+        self.refresh_at = self.expires_at - min(TOKEN_REFRESH_MARGIN, lifetime * 0.2)
+
+
+class TokenCache:
+    """
+    Process-wide JWT cache shared by every HorizonAPI instance.
+
+    Entries are keyed by server URL plus a hash of the API key. Only one caller
+    fetches a token at a time; concurrent callers wait for it. Tokens close to
+    expiry are refreshed in a background thread while the current one is still served.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def make_key(base_url, api_key):
+        digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+        return f"{base_url}|{digest}"
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _TokenEntry()
+            return entry
+
+    def get(self, key, fetch):
+        """Return a valid token for key, calling fetch() when a new one is needed"""
+        entry = self._entry(key)
+        with entry.condition:
+            while True:
+                now = time.time()
+                if entry.token and now < entry.expires_at:
+                    if now >= entry.refresh_at and not entry.refreshing:
+                        entry.refreshing = True
+                        threading.Thread(target=self._refresh, args=(entry, fetch),
+                                         name='horizon-token-refresh', daemon=True).start()
+                    return entry.token
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    break
+                entry.condition.wait()
+
+        try:
+            token = fetch()
+        except Exception:
+            with entry.condition:
+                entry.refreshing = False
+                entry.condition.notify_all()
+            raise
+        with entry.condition:
+            entry.store(token)
+            entry.refreshing = False
+            entry.condition.notify_all()
+        return token
+
+    @staticmethod
+    def _refresh(entry, fetch):
+        try:
+            token = fetch()
+        except Exception as e:
+            logger.warning(f"Background token refresh failed: {str(e)}")
+            token = None
+        with entry.condition:
+            if token:
+                entry.store(token)
+            entry.refreshing = False
+            entry.condition.notify_all()
+
+    def invalidate(self, key, token=None):
+        """Drop the cached token for key, unless it was already replaced by a newer one than token"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        with entry.condition:
+            if token is None or entry.token == token:
+                entry.token = None
+                entry.expires_at = entry.refresh_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the call and
+    the callers arriving while it is in flight wait for and share its result or error.
+    Nothing is kept once the call finished, so a shared result is never stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @staticmethod
+    def make_key(*parts):
+        canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def do(self, key, fn):
+        """Return (result, shared), where shared tells whether other callers got the same result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.followers > 0
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+inflight_requests = SingleFlight()
+
+
+def config_key(config):
+    """Key identifying a connector configuration by server URL and API key hash"""
+    base_url = config.get('server_url', 'https://api.horizon3ai.com').rstrip('/')
+    return TokenCache.make_key(base_url, config.get('api_token'))
+
+
+def safe_number(value, default, cast=int):
+    """Convert a config value to a number, falling back to a default if it is empty or invalid"""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_after_delay(headers):
+    """Seconds to wait according to a Retry-After header, or None if absent or unreadable"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), BACKOFF_CAP)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(key, pool_size=DEFAULT_POOL_SIZE):
+    """Return the pooled keep-alive session for a config, creating it on first use"""
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[key] = session
+        return session
+
+
+def close_sessions(config=None):
+    """Close the pooled session for a config, or every session when no config is given"""
+    with _sessions_lock:
+        if config:
+            keys = [config_key(config)]
+        else:
+            keys = list(_sessions)
+        sessions = [_sessions.pop(key) for key in keys if key in _sessions]
+    for session in sessions:
+        session.close()
+
 
 class HorizonAPI:
     def __init__(self, config):
         self.api_key = config.get('api_token')
         self.verify_ssl = config.get('verify_ssl', True)
         self.base_url = config.get('server_url', 'https://api.horizon3ai.com').rstrip('/')
+        self.timeout = safe_number(config.get('timeout'), DEFAULT_TIMEOUT, float)
+        self.max_retries = safe_number(config.get('max_retries'), DEFAULT_MAX_RETRIES, int)
         self._jwt_token = None
+        self._token_key = TokenCache.make_key(self.base_url, self.api_key)
+        self.session = get_session(self._token_key, safe_number(config.get('pool_size'), DEFAULT_POOL_SIZE, int))
+        self.profile_rate = safe_number(config.get('profile_sample_rate'), DEFAULT_PROFILE_SAMPLE_RATE, float) \
+            if config.get('profile_payloads') else 0
+        self.limiter = get_limiter(
+            self.base_url,
+            safe_number(config.get('rate_limit'), DEFAULT_RATE_LIMIT, float),
+            safe_number(config.get('rate_burst'), DEFAULT_RATE_BURST, int),
+            safe_number(config.get('max_concurrency'), DEFAULT_MAX_CONCURRENCY, int)
+        )
+
+    def _post(self, url, headers, payload, stream=False, stats=None, fail_fast=False):
+        """
+        POST with bounded retries for throttling, server errors and dropped connections.
+        The number of retries is added to stats['retries'] when stats is given. With
+        fail_fast, timeouts and size errors are not retried but raised as PageSizeError.
+        """
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire()
+            if waited > 1:
+                logger.info(f"Request to {url} waited {waited:.2f}s for the rate limiter")
+            throttled = True
+            try:
+                response = self.session.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    verify=self.verify_ssl,
+                    timeout=self.timeout,
+                    stream=stream
+                )
+                throttled = response.status_code in RETRYABLE_STATUS_CODES
+            except RETRYABLE_EXCEPTIONS as e:
+                self.limiter.release(throttled)
+                if fail_fast and isinstance(e, requests.exceptions.Timeout):
+                    raise PageSizeError(f"Request to {url} timed out: {str(e)}")
+                delay = self._retry_delay(url, attempt, error=e)
+                if delay is None:
+                    raise
+            except Exception:
+                self.limiter.release(throttled)
+                raise
+            else:
+                self.limiter.release(throttled)
+                if fail_fast and response.status_code in SIZE_ERROR_STATUS_CODES:
+                    response.close()
+                    raise PageSizeError(f"HTTP Error: {response.status_code} - page too large or too slow")
+                delay = self._retry_delay(url, attempt, response.status_code, response.headers)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            if stats is not None:
+                stats['retries'] += 1
+            time.sleep(delay)
+
+    def _retry_delay(self, url, attempt, status=None, headers=None, error=None):
+        """
+        Seconds to wait before retrying a POST that raised error or answered with status,
+        or None when it is not retried. Shared by the blocking and the asyncio transport.
+        """
+        if attempt >= self.max_retries or (error is None and status not in RETRYABLE_STATUS_CODES):
+            return None
+        if error is not None:
+            delay = backoff_delay(attempt)
+            logger.warning(f"Request to {url} failed ({str(error)}), retrying in {delay:.2f}s")
+            return delay
+        delay = retry_after_delay(headers or {})
+        if delay is None:
+            delay = backoff_delay(attempt)
+        logger.warning(f"Request to {url} returned {status}, retrying in {delay:.2f}s")
+        return delay
 
     def _get_jwt_token(self):
         """Get JWT token using API key"""
@@ -22,12 +373,8 @@ class HorizonAPI:
                 "key": self.api_key
             }
 
-            response = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                verify=self.verify_ssl
-            )
+            response = self._post(url, headers, payload)
+            metrics.increment('token_refreshes')
 
             if response.status_code == 200:
                 data = response.json()
@@ -40,56 +387,340 @@ class HorizonAPI:
             raise ConnectorError(f"Authentication failed: {str(e)}")
 
     def _get_auth_token(self):
-        """Get or refresh JWT token"""
-        if not self._jwt_token:
-            self._jwt_token = self._get_jwt_token()
+        """Get or refresh JWT token from the process-wide cache"""
+        self._jwt_token = token_cache.get(self._token_key, self._get_jwt_token)
         return self._jwt_token
 
-    def make_request(self, query, variables=None):
-        try:
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self._get_auth_token()}'
-            }
+    def _invalidate_token(self):
+        token_cache.invalidate(self._token_key, self._jwt_token)
+        self._jwt_token = None
+
+    def _auth_headers(self, graphql_operation):
+        """Request headers with a bearer token, recording how long getting the token took"""
+        started = time.perf_counter()
+        token = self._get_auth_token()
+        metrics.observe(graphql_operation, 'auth_seconds', time.perf_counter() - started)
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+
+    @staticmethod
+    def _observe_response(graphql_operation, ttfb_seconds, request_bytes, response_bytes, decode_seconds):
+        metrics.observe(graphql_operation, 'ttfb_seconds', ttfb_seconds)
+        metrics.observe(graphql_operation, 'request_bytes', request_bytes)
+        metrics.observe(graphql_operation, 'response_bytes', response_bytes)
+        metrics.observe(graphql_operation, 'decode_seconds', decode_seconds)
+
+    def _check_errors(self, data, retry_auth, allow_errors=False, fail_fast=False):
+        """
+        Handle the GraphQL errors of a decoded response. Returns True when the token was
+        rejected and retry_auth allows another attempt with a fresh one; other errors
+        raise unless allow_errors is set.
+        """
+        if 'errors' not in data:
+            return False
+        if retry_auth and any('authentication' in str(error).lower() for error in data['errors']):
+            # Token might be expired, try refreshing
+            self._invalidate_token()
+            return True
+        if allow_errors:
+            return False
+        if fail_fast and SIZE_ERROR.search(str(data['errors'])):
+            raise PageSizeError(f"GraphQL Error: {data['errors']}")
+        raise ConnectorError(f"GraphQL Error: {data['errors']}")
+
+    @staticmethod
+    def _unpack(data, allow_errors=False):
+        """The data key of a response body, or the whole body with allow_errors"""
+        if allow_errors or 'data' not in data:
+            return data
+        return data['data']
+
+    def _profile(self, graphql_operation, data, response_bytes):
+        """Add a decoded response to the payload profile when profiling samples it"""
+        sample = payload_profiler.start(graphql_operation, self.profile_rate)
+        if sample is not None:
+            sample.add(data['data'] if isinstance(data, dict) and 'data' in data else data)
+            sample.close(response_bytes)
+
+    def make_request(self, query, variables=None, allow_errors=False, stats=None, fail_fast=False):
+        """
+        Run a GraphQL query and return its unpacked data. With allow_errors, GraphQL errors
+        (other than authentication errors) do not raise and the whole body is returned, so
+        a caller can keep the partial data of a batched query.
+
+        Identical requests for the same server and credential that are in flight at the same
+        time share one upstream call; each caller gets its own copy of the result.
+
+        stats, when given, receives the retries and response_bytes of the request. fail_fast
+        raises PageSizeError on timeouts and size errors instead of retrying them.
+        """
+        key = SingleFlight.make_key(query, variables, allow_errors, self._token_key)
+        led = []
+
+        def request():
+            led.append(True)
+            return self._request(query, variables, allow_errors, stats, fail_fast)
 
+        result, shared = inflight_requests.do(key, request)
+        if not led:
+            metrics.increment('coalesced_requests')
+        if shared:
+            # callers may modify the result, so a shared one is never handed out as is
+            return copy.deepcopy(result)
+        return result
+
+    def _request(self, query, variables, allow_errors, stats=None, fail_fast=False):
+        graphql_operation = graphql_operation_name(query)
+        started = time.perf_counter()
+        stats = stats if stats is not None else {}
+        stats['retries'] = 0
+        try:
             payload = {
                 'query': query
             }
             if variables:
                 payload['variables'] = variables
 
-            response = requests.post(
-                f"{self.base_url}/v1/graphql",
-                headers=headers,
-                json=payload,
-                verify=self.verify_ssl
-            )
+            # A rejected token is refreshed and the request retried exactly once
+            for auth_attempt in range(2):
+                headers = self._auth_headers(graphql_operation)
 
-            if response.status_code == 200:
-                data = response.json()
-                if 'errors' in data:
-                    if any('authentication' in str(error).lower() for error in data['errors']):
-                        # Token might be expired, try refreshing
-                        self._jwt_token = None
-                        # Retry request once with new token
-                        return self.make_request(query, variables)
-                    raise ConnectorError(f"GraphQL Error: {data['errors']}")
-                # unpack data key if present
-                if 'data' in data:
-                    return data['data']
-                else:
-                    return data
-            elif response.status_code == 401:
-                # Token expired, try refreshing
-                self._jwt_token = None
-                # Retry request once with new token
-                return self.make_request(query, variables)
-            else:
+                response = self._post(f"{self.base_url}/v1/graphql", headers, payload, stats=stats,
+                                      fail_fast=fail_fast)
+
+                if response.status_code == 200:
+                    decode_started = time.perf_counter()
+                    data = response.json()
+                    stats['response_bytes'] = len(response.content)
+                    self._observe_response(graphql_operation, response.elapsed.total_seconds(),
+                                           len(response.request.body or b''), len(response.content),
+                                           time.perf_counter() - decode_started)
+                    self._profile(graphql_operation, data, len(response.content))
+                    if self._check_errors(data, auth_attempt == 0, allow_errors, fail_fast):
+                        continue
+                    return self._unpack(data, allow_errors)
+                elif response.status_code == 401 and auth_attempt == 0:
+                    # Token expired, try refreshing
+                    self._invalidate_token()
+                    continue
                 raise ConnectorError(f"HTTP Error: {response.status_code} - {response.text}")
 
         except Exception as e:
             logger.error(f"Error making request: {str(e)}")
+            metrics.increment('errors')
+            if isinstance(e, PageSizeError):
+                raise
             raise ConnectorError(str(e))
+        finally:
+            metrics.observe(graphql_operation, 'latency_seconds', time.perf_counter() - started)
+            metrics.observe(graphql_operation, 'retries', stats['retries'])
+
+    def iter_stream(self, query, variables, page_key, records_key, stats=None, fail_fast=False):
+        """
+        Stream a paged query, yielding the records of data.<page_key>.<records_key> as they
+        are decoded from the response body instead of materialising the whole response.
+
+        The generator returns the rest of the unpacked data (with the record list empty),
+        so callers can use page_info via "result = yield from api.iter_stream(...)".
+        GraphQL errors are detected once the body is complete; an authentication error is
+        retried with a fresh token as long as no record has been yielded yet. stats and
+        fail_fast work as for make_request.
+        """
+        graphql_operation = graphql_operation_name(query)
+        started = time.perf_counter()
+        stats = stats if stats is not None else {}
+        stats['retries'] = 0
+        payload = {
+            'query': query
+        }
+        if variables:
+            payload['variables'] = variables
+
+        try:
+            data = yield from self._stream_attempts(graphql_operation, payload, page_key, records_key, stats,
+                                                    fail_fast)
+        except Exception:
+            metrics.increment('errors')
+            raise
+        finally:
+            metrics.observe(graphql_operation, 'latency_seconds', time.perf_counter() - started)
+            metrics.observe(graphql_operation, 'retries', stats['retries'])
+        return data
+
+    def _stream_attempts(self, graphql_operation, payload, page_key, records_key, stats, fail_fast=False):
+        for auth_attempt in range(2):
+            headers = self._auth_headers(graphql_operation)
+            try:
+                response = self._post(f"{self.base_url}/v1/graphql", headers, payload, stream=True, stats=stats,
+                                      fail_fast=fail_fast)
+            except PageSizeError:
+                raise
+            except Exception as e:
+                logger.error(f"Error making request: {str(e)}")
+                raise ConnectorError(str(e))
+
+            with response:
+                if response.status_code == 401 and auth_attempt == 0:
+                    self._invalidate_token()
+                    continue
+                if response.status_code != 200:
+                    raise ConnectorError(f"HTTP Error: {response.status_code} - {response.text}")
+
+                parser = RecordStreamParser(['data', page_key, records_key])
+                sample = payload_profiler.start(graphql_operation, self.profile_rate)
+                record_path = f"{page_key}.{records_key}[]"
+                response_bytes = 0
+                decode_seconds = 0.0
+                try:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        response_bytes += len(chunk)
+                        decode_started = time.perf_counter()
+                        records = parser.feed(chunk)
+                        decode_seconds += time.perf_counter() - decode_started
+                        if sample is not None:
+                            for record in records:
+                                sample.add(record, record_path)
+                        yield from records
+                    records = parser.feed(b'', final=True)
+                    if sample is not None:
+                        for record in records:
+                            sample.add(record, record_path)
+                    yield from records
+                    data = parser.close()
+                    stats['response_bytes'] = response_bytes
+                    self._observe_response(graphql_operation, response.elapsed.total_seconds(),
+                                           len(response.request.body or b''), response_bytes, decode_seconds)
+                    if sample is not None:
+                        # the rest of the document, with the streamed record list left empty
+                        sample.add(data.get('data'))
+                        sample.close(response_bytes)
+                except ValueError as e:
+                    raise ConnectorError(f"Invalid JSON response: {str(e)}")
+                except requests.exceptions.RequestException as e:
+                    logger.error(f"Error reading streamed response: {str(e)}")
+                    if fail_fast and isinstance(e, (requests.exceptions.Timeout,
+                                                    requests.exceptions.ConnectionError)):
+                        raise PageSizeError(str(e))
+                    raise ConnectorError(str(e))
+
+            # a token error can only be retried as long as no record was yielded
+            if self._check_errors(data, auth_attempt == 0 and parser.count == 0, fail_fast=fail_fast):
+                continue
+            return self._unpack(data)
+
+    def stream_request(self, query, variables, page_key, records_key):
+        """
+        Run a paged query through iter_stream, collecting the decoded records back into
+        the result.
+        """
+        stream = self.iter_stream(query, variables, page_key, records_key)
+        records = []
+        while True:
+            try:
+                records.append(next(stream))
+            except StopIteration as stop:
+                result = stop.value
+                break
+        if isinstance((result or {}).get(page_key), dict):
+            result[page_key][records_key] = records
+        return result
+
+    def paginate(self, query, variables, page_key, records_key, max_records=None, stream=False, adaptive=False,
+                 max_page_size=DEFAULT_MAX_PAGE_SIZE):
+        """
+        Yield the records of a paged query one at a time, requesting the next page only
+        once the current one is exhausted, so a single page is held in memory. With
+        stream set, records are yielded while each page is still being decoded.
+
+        Pages are advanced by page_num; paging stops on a short page, or when the
+        page_info.end_cursor stops moving. A page is short when it holds fewer records
+        than page_info.page_size, the size the server actually served. With adaptive set,
+        the page size follows the response size and latency of previous pages (see
+        PageSizer), is capped to the size the server serves, and is halved and the page
+        retried at once when the server times out or reports a size error.
+        """
+        page_input = dict(variables.get('page_input') or {})
+        page_size = page_input.get('page_size') or 50
+        page_num = page_input.get('page_num') or 1
+        sizer = PageSizer(page_size, (page_num - 1) * page_size, max_page_size) if adaptive else None
+        last_cursor = None
+        yielded = 0
+        skip = 0
+        # largest page size the server served in full
+        confirmed = 0
+        while True:
+            if sizer:
+                page_size = sizer.size
+                page_num = sizer.page_num
+            page_input['page_size'] = page_size
+            page_input['page_num'] = page_num
+            page_variables = dict(variables, page_input=page_input)
+            stats = {}
+            started = time.perf_counter()
+            count = 0
+            # A larger page than the server served so far may be capped, and past the first
+            # page a capped page holds other records than page_num meant; such a page is read
+            # whole so it can be dropped instead of streamed
+            streamed = stream and not (sizer and sizer.offset and page_size > confirmed)
+            try:
+                if streamed:
+                    records = self.iter_stream(query, page_variables, page_key, records_key, stats, bool(sizer))
+                else:
+                    result = self.make_request(query, page_variables, stats=stats, fail_fast=bool(sizer))
+                    page = (result or {}).get(page_key) or {}
+                    served = (page.get('page_info') or {}).get('page_size')
+                    if sizer and served and served < page_size:
+                        # the server caps the page size; page_num would address other records
+                        logger.info(f"Server returned pages of {served} records, limiting the page size")
+                        sizer.cap(served)
+                        continue
+                    records = iter(page.get(records_key) or [])
+                while True:
+                    try:
+                        record = next(records)
+                    except StopIteration as stop:
+                        if streamed:
+                            result = stop.value
+                        break
+                    count += 1
+                    if count <= skip:
+                        # already yielded before the page was retried with a smaller size
+                        continue
+                    yield record
+                    yielded += 1
+                    if max_records and yielded >= max_records:
+                        return
+            except PageSizeError as e:
+                skip = sizer.shrink(max(count, skip)) if sizer else None
+                if skip is None:
+                    raise ConnectorError(str(e))
+                logger.warning(f"Page of {page_size} records failed ({str(e)}), retrying with {sizer.size}")
+                continue
+            done = max(count, skip)
+            skip = 0
+            page_info = ((result or {}).get(page_key) or {}).get('page_info') or {}
+            served = page_info.get('page_size')
+            if sizer and served and served < page_size:
+                # a streamed first page: it is requested again at the served size, skipping
+                # the records that are already out
+                logger.info(f"Server returned pages of {served} records, limiting the page size")
+                skip = sizer.cap(served, done)
+                continue
+            confirmed = max(confirmed, page_size)
+            if not sizer and served and served < page_size:
+                # the server caps the page size and numbers its pages by the size it served
+                logger.info(f"Server returned pages of {served} records, limiting the page size")
+                page_size = served
+            cursor = page_info.get('end_cursor')
+            if count < page_size or (cursor and cursor == last_cursor):
+                return
+            last_cursor = cursor
+            if sizer:
+                sizer.advance(stats.get('response_bytes'), time.perf_counter() - started)
+            else:
+                page_num += 1
 
     def check_health(self):
         """Check API health using hello query"""
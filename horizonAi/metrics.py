@@ -0,0 +1,165 @@
+import contextvars
+import re
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Upper bounds of the histogram buckets, the last bucket is unbounded
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+METRICS = {
+    'auth_seconds': SECONDS_BUCKETS,
+    'ttfb_seconds': SECONDS_BUCKETS,
+    'latency_seconds': SECONDS_BUCKETS,
+    'decode_seconds': SECONDS_BUCKETS,
+    'request_bytes': BYTES_BUCKETS,
+    'response_bytes': BYTES_BUCKETS,
+    'retries': COUNT_BUCKETS,
+}
+
+_operation = contextvars.ContextVar('horizon_operation', default='unknown')
+_GRAPHQL_NAME = re.compile(r'\b(?:query|mutation)\s+(\w+)')
+
+
+@contextmanager
+def operation_context(name):
+    """Attribute the requests made inside the block to a connector operation"""
+    token = _operation.set(name)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+
+def current_operation():
+    return _operation.get()
+
+
+@lru_cache(maxsize=512)
+def graphql_operation_name(query):
+    match = _GRAPHQL_NAME.search(query or '')
+    return match.group(1) if match else 'anonymous'
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing a value is a bisect and a few additions under a lock"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'min', 'max', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min is None or value < self.min else self.min
+            self.max = value if self.max is None or value > self.max else self.max
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the given percentile"""
+        if not self.count:
+            return None
+        target = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        with self._lock:
+            count, total, low, high = self.count, self.sum, self.min, self.max
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else None,
+            "min": low,
+            "max": high,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99)
+        }
+
+
+class MetricsRegistry:
+    """Histograms and counters labelled by connector operation and GraphQL operation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, graphql_operation, metric, value):
+        key = (current_operation(), graphql_operation, metric)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(METRICS[metric]))
+        histogram.observe(value)
+
+    def increment(self, name, value=1):
+        key = (current_operation(), name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        operations = {}
+        for (operation, graphql_operation, metric), histogram in sorted(histograms.items()):
+            operations.setdefault(operation, {}).setdefault(graphql_operation, {})[metric] = histogram.summary()
+        totals = {}
+        for (operation, name), value in sorted(counters.items()):
+            totals.setdefault(operation, {})[name] = value
+        return {"operations": operations, "counters": totals}
+
+    def prometheus(self, prefix='horizon'):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        lines = []
+        for metric in METRICS:
+            series = sorted((key, histogram) for key, histogram in histograms.items() if key[2] == metric)
+            if not series:
+                continue
+            name = f"{prefix}_request_{metric}"
+            lines.append(f"# TYPE {name} histogram")
+            for (operation, graphql_operation, _), histogram in series:
+                labels = f'operation="{operation}",graphql_operation="{graphql_operation}"'
+                with histogram._lock:
+                    counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+                cumulative = 0
+                for bound, bucket_count in zip(list(histogram.bounds) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {total}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+        for counter in sorted({name for _, name in counters}):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            for (operation, name), value in sorted(counters.items()):
+                if name == counter:
+                    lines.append(f'{prefix}_{counter}_total{{operation="{operation}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,197 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from connectors.core.connector import get_logger, ConnectorError
+
+from .models import Record
+from .state import state_path
+
+logger = get_logger('horizon-ai')
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS pentests (
+    op_id TEXT PRIMARY KEY,
+    name TEXT,
+    state TEXT,
+    client_name TEXT,
+    launched_at TEXT,
+    completed_at TEXT,
+    etl_completed_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS weaknesses (
+    uuid TEXT PRIMARY KEY,
+    op_id TEXT NOT NULL,
+    vuln_id TEXT,
+    ip TEXT,
+    host_name TEXT,
+    severity TEXT,
+    score REAL,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attack_paths (
+    uuid TEXT PRIMARY KEY,
+    op_id TEXT NOT NULL,
+    impact_type TEXT,
+    ip TEXT,
+    host_name TEXT,
+    severity TEXT,
+    score REAL,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pentests_launched_at ON pentests (launched_at);
+CREATE INDEX IF NOT EXISTS weaknesses_op_id ON weaknesses (op_id);
+CREATE INDEX IF NOT EXISTS weaknesses_vuln_id ON weaknesses (vuln_id, op_id);
+CREATE INDEX IF NOT EXISTS weaknesses_ip ON weaknesses (ip);
+CREATE INDEX IF NOT EXISTS weaknesses_host_name ON weaknesses (host_name);
+CREATE INDEX IF NOT EXISTS weaknesses_severity ON weaknesses (severity);
+CREATE INDEX IF NOT EXISTS weaknesses_created_at ON weaknesses (created_at);
+CREATE INDEX IF NOT EXISTS attack_paths_op_id ON attack_paths (op_id);
+CREATE INDEX IF NOT EXISTS attack_paths_ip ON attack_paths (ip);
+CREATE INDEX IF NOT EXISTS attack_paths_host_name ON attack_paths (host_name);
+CREATE INDEX IF NOT EXISTS attack_paths_severity ON attack_paths (severity);
+CREATE INDEX IF NOT EXISTS attack_paths_created_at ON attack_paths (created_at);
+"""
+
+# Indexed columns per table, taken from the records; the full record is kept as JSON in data
+COLUMNS = {
+    'pentests': ('op_id', 'name', 'state', 'client_name', 'launched_at', 'completed_at', 'etl_completed_at'),
+    'weaknesses': ('uuid', 'op_id', 'vuln_id', 'ip', 'host_name', 'severity', 'score', 'created_at'),
+    'attack_paths': ('uuid', 'op_id', 'impact_type', 'ip', 'host_name', 'severity', 'score', 'created_at'),
+}
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def mirror_path(config):
+    return config.get('mirror_path') or state_path(config, 'mirror', '.sqlite')
+
+
+def _row(table, record):
+    values = [record.get(column) for column in COLUMNS[table]]
+    if table == 'weaknesses' and values[4] is None:
+        # weaknesses name their host in affected_asset_text
+        values[4] = record.get('affected_asset_text')
+    data = record.to_json() if isinstance(record, Record) else json.dumps(record, separators=(',', ':'))
+    return values + [data]
+
+
+class Mirror:
+    """
+    Local SQLite copy of pentests, weaknesses and attack paths, indexed for lookups by
+    ip, host name, vuln_id, op_id, severity and creation time.
+
+    The database runs in WAL mode so lookups are not blocked by a running sync. Writes
+    to one database file are serialised by a process-wide lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+                           (str(SCHEMA_VERSION),))
+        self._conn.commit()
+        with _write_locks_lock:
+            self._write_lock = _write_locks.setdefault(path, threading.Lock())
+
+    @classmethod
+    def open(cls, config, create=True):
+        path = mirror_path(config)
+        if not create:
+            try:
+                open(path, 'rb').close()
+            except OSError:
+                raise ConnectorError("The local mirror is empty, run Sync Mirror first")
+        return cls(path)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        with self._write_lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def get_meta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def upsert_pentests(self, pentests):
+        placeholders = ', '.join('?' * (len(COLUMNS['pentests']) + 1))
+        with self.transaction() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO pentests VALUES ({placeholders})",
+                             (_row('pentests', pentest) for pentest in pentests))
+
+    def replace_op(self, op_id, weaknesses, attack_paths):
+        """Replace the weaknesses and attack paths of one op in a single transaction"""
+        with self.transaction() as conn:
+            for table, records in (('weaknesses', weaknesses), ('attack_paths', attack_paths)):
+                if records is None:
+                    continue
+                conn.execute(f"DELETE FROM {table} WHERE op_id = ?", (op_id,))
+                placeholders = ', '.join('?' * (len(COLUMNS[table]) + 1))
+                conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+                                 (_row(table, record) for record in records))
+
+    def weaknesses_by_ip(self, ip, severity=None, limit=None):
+        sql = 'SELECT data FROM weaknesses WHERE ip = ?'
+        args = [ip]
+        if severity:
+            sql += f" AND severity IN ({', '.join('?' * len(severity))})"
+            args.extend(severity)
+        sql += ' ORDER BY created_at DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        return [json.loads(row[0]) for row in self._conn.execute(sql, args)]
+
+    def ops_by_vuln(self, vuln_id):
+        rows = self._conn.execute(
+            """
+            SELECT w.op_id, p.name, p.launched_at, p.etl_completed_at, COUNT(*), GROUP_CONCAT(DISTINCT w.ip)
+            FROM weaknesses w LEFT JOIN pentests p ON p.op_id = w.op_id
+            WHERE w.vuln_id = ?
+            GROUP BY w.op_id
+            ORDER BY p.launched_at DESC
+            """, (vuln_id,))
+        return [{
+            "op_id": op_id,
+            "name": name,
+            "launched_at": launched_at,
+            "etl_completed_at": etl_completed_at,
+            "weaknesses_count": count,
+            "ips": sorted(ips.split(',')) if ips else []
+        } for op_id, name, launched_at, etl_completed_at, count, ips in rows]
+
+    def stats(self):
+        counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in COLUMNS}
+        return dict(counts, path=self.path, watermark=self.get_meta('watermark'))
@@ -0,0 +1,123 @@
+import json
+import sys
+
+from .queries import ATTACK_PATH_FIELDS, PENTEST_FIELDS, WEAKNESS_FIELDS
+
+_COMPACT = (',', ':')
+
+
+class Record:
+    """
+    Compact, slotted stand-in for an API record dict.
+
+    Fields with few distinct values (severity, op_id, ...) are interned so every record
+    shares one string object. Heavy text and nested fields are kept as UTF-8 encoded
+    JSON and only decoded when accessed. Fields absent from the source dict stay unset,
+    so to_dict() returns exactly the fields that were selected.
+    """
+
+    __slots__ = ()
+    fields = ()
+    interned = frozenset()
+    heavy = frozenset()
+
+    @classmethod
+    def from_dict(cls, record):
+        obj = cls.__new__(cls)
+        for field, value in record.items():
+            if field in cls.heavy:
+                setattr(obj, '_' + field, json.dumps(value, separators=_COMPACT).encode('utf-8'))
+            elif field in cls.fields:
+                if field in cls.interned and type(value) is str:
+                    value = sys.intern(value)
+                setattr(obj, field, value)
+        return obj
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in self.fields else default
+
+    def raw(self, field):
+        """Encoded JSON of a heavy field, or None when it is not set"""
+        return getattr(self, '_' + field, None)
+
+    def to_dict(self):
+        record = {}
+        for field in self.fields:
+            try:
+                record[field] = getattr(self, field)
+            except AttributeError:
+                pass
+        return record
+
+    def to_json(self):
+        """Compact JSON of to_dict(), with heavy fields spliced in without decoding them"""
+        parts = []
+        for field in self.fields:
+            if field in self.heavy:
+                encoded = self.raw(field)
+                if encoded is None:
+                    continue
+                value = encoded.decode('utf-8')
+            else:
+                try:
+                    value = json.dumps(getattr(self, field), separators=_COMPACT)
+                except AttributeError:
+                    continue
+            parts.append(f"{json.dumps(field)}:{value}")
+        return '{' + ','.join(parts) + '}'
+
+    def __repr__(self):
+        key = self.get('uuid') or self.get('op_id')
+        return f"{type(self).__name__}({key!r})"
+
+
+def _heavy_property(field):
+    slot = '_' + field
+
+    def getter(self):
+        return json.loads(getattr(self, slot))
+    return property(getter, doc=f"{field}, decoded on access")
+
+
+def _model(name, fields, interned, heavy):
+    heavy = frozenset(heavy) & frozenset(fields)
+    namespace = {
+        '__slots__': tuple(('_' + field) if field in heavy else field for field in fields),
+        'fields': tuple(fields),
+        'interned': frozenset(interned),
+        'heavy': heavy,
+    }
+    namespace.update({field: _heavy_property(field) for field in heavy})
+    return type(name, (Record,), namespace)
+
+
+Weakness = _model(
+    'Weakness', WEAKNESS_FIELDS,
+    interned=('op_id', 'vuln_id', 'vuln_category', 'ip', 'severity', 'base_severity', 'context_severity',
+              'affected_asset_text', 'diff_status', 'time_to_finding_hms', 'proof_failure_code'),
+    heavy=('context_score_description_md', 'context_score_description', 'downstream_impact_types_and_counts',
+           'proof_failure_reason', 'vuln_aliases', 'downstream_impact_types', 'mitre_mappings'))
+
+AttackPath = _model(
+    'AttackPath', ATTACK_PATH_FIELDS,
+    interned=('op_id', 'impact_type', 'severity', 'ip', 'host_name', 'host_text', 'affected_asset_text',
+              'target_entity_text', 'time_to_finding_hms'),
+    heavy=('impact_description', 'context_score_description_md', 'weakness_refs', 'credential_refs', 'host_refs'))
+
+Pentest = _model(
+    'Pentest', PENTEST_FIELDS,
+    interned=('op_type', 'state', 'user_name', 'client_name'),
+    heavy=())
+
+MODELS = {
+    'weaknesses': Weakness,
+    'attack_paths': AttackPath,
+    'pentests': Pentest,
+}
+
+
+def to_models(entity, records):
+    """Lazily wrap record dicts of an entity in its model"""
+    model = MODELS[entity]
+    return (model.from_dict(record) for record in records)
+
@@ -1,30 +1,64 @@
+import asyncio
+import contextvars
 import enum
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 from connectors.core.connector import get_logger, ConnectorError
 
-from .horizon_api_auth import HorizonAPI
+from .async_client import AsyncHorizonAPI, async_available, run_sync
+from .batching import DEFAULT_MAX_BATCH_COST, batch_op_pages
+from .cache import (DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_SIZE, RUNNING_TTL, cache_key, response_cache,
+                    ttl_for_completion)
+from .diff import DEFAULT_MAX_FINDINGS, DIFF_FIELDS, diff_findings
+from .export import DEFAULT_EXPORT_PAGE_SIZE, NDJSONExport
+from .filters import plan_filters
+from .graph import GRAPH_FIELDS, AttackPathGraph, chunked
+from .horizon_api_auth import HorizonAPI, close_sessions, config_key, token_cache
+from .metrics import metrics
+from .mirror import Mirror
+from .models import to_models
+from .paging import DEFAULT_MAX_PAGE_SIZE
+from .profiler import payload_profiler
+from .queries import ENTITIES, PENTEST_STATUS_QUERY, op_page_query, pentests_query, resolve_fields
+from .rollup import DEFAULT_TOP_N, ROLLUP_STATE, ROLLUP_VERSION, SUMMARY_FIELDS, aggregate_weaknesses, summarize
+from .state import load_state, state_dir, update_state
+from .throttle import limiter_stats
 
 logger = get_logger('horizon-ai')
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_WATERMARK_FIELD = 'etl_completed_at'
+WATERMARK_STATE = 'pentest_watermarks'
+MIRROR_ENTITIES = ('weaknesses', 'attack_paths')
+PREFETCH_PAGE_SIZE = 50
+PREFETCH_FIELDS = ('op_id', 'launched_at', 'etl_completed_at')
+NESTED_COUNT_FIELDS = {
+    'attack_paths': 'attack_paths_count',
+    'weaknesses': 'weaknesses_count'
+}
+
 
 class SortOrder(enum.Enum):
     ASC = "ASC"
     DESC = "DESC"
 
 
-def build_page_input(params):
+def safe_int(value, default):
     """
-    Build the PageInput object from provided parameters
+    Safely convert a value to an integer, falling back to a default if conversion fails.
     """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
 
-    def safe_int(value, default):
-        """
-        Safely convert a value to an integer, falling back to a default if conversion fails.
-        """
-        try:
-            return int(value)
-        except (TypeError, ValueError):
-            return default
+
+def build_page_input(params, plan=None):
+    """
+    Build the PageInput object from provided parameters, adding the server-side part
+    of a FilterPlan when one is given
+    """
 
     # Safely enforce integers for page_num and page_size
     page_input = {
@@ -33,8 +67,9 @@ def build_page_input(params):
     }
 
     # Add ordering if specified
-    if params.get('order_by'):
-        page_input["order_by"] = params['order_by']
+    order_by = plan.order_by if plan is not None else params.get('order_by')
+    if order_by:
+        page_input["order_by"] = order_by
         page_input["sort_order"] = params.get('sort_order', 'ASC')
 
     # Add text search if specified
@@ -72,6 +107,9 @@ def build_page_input(params):
             "values": params['client_name']
         })
 
+    if plan is not None:
+        filters.extend(plan.server_filters)
+
     # Add the filters if any were created
     if filters:
         page_input["filter_by_inputs"] = filters
@@ -79,202 +117,438 @@ def build_page_input(params):
     return page_input
 
 
+def paging_options(params):
+    """Adaptive page sizing options of paginate taken from the operation parameters"""
+    return {
+        "adaptive": bool(params.get('adaptive_page_size')),
+        "max_page_size": safe_int(params.get('max_page_size'), DEFAULT_MAX_PAGE_SIZE) or DEFAULT_MAX_PAGE_SIZE
+    }
+
+
+def fetch_all_pages(horizon, query, variables, page_key, records_key, params, plan=None):
+    """
+    Follow every page of a paged query and return the records as one page.
+
+    The local filters of a plan are applied as the records arrive, so max_records
+    counts matching records.
+    """
+    max_records = safe_int(params.get('max_records'), None)
+    filtered = plan is not None and bool(plan.local_filters)
+    records = horizon.paginate(query, variables, page_key, records_key, None if filtered else max_records,
+                               stream=bool(params.get('stream_response')), **paging_options(params))
+    if filtered:
+        records = plan.apply(records, max_records)
+    collected = list(records)
+    if plan is not None:
+        collected = plan.finish(collected)
+    count = len(collected)
+    page_info = {
+        "page_size": count,
+        "total_count": count,
+        "has_next_page": bool(max_records) and count >= max_records
+    }
+    return {page_key: {records_key: collected, "page_info": page_info}}
+
+
+def parse_op_ids(value):
+    """
+    Normalise the op_id parameter to a list of unique IDs, accepting a single ID,
+    a list of IDs or a comma separated string.
+    """
+    if isinstance(value, (list, tuple)):
+        candidates = value
+    elif isinstance(value, str):
+        candidates = value.split(',')
+    elif value:
+        candidates = [value]
+    else:
+        candidates = []
+    op_ids = []
+    for candidate in candidates:
+        op_id = str(candidate).strip() if candidate is not None else ''
+        if op_id and op_id not in op_ids:
+            op_ids.append(op_id)
+    return op_ids
+
+
+def response_cache_dir(config):
+    """Directory for persisted response cache entries, or None when persistence is off"""
+    if config.get('persist_cache'):
+        return os.path.join(state_dir(config), 'cache')
+    return None
+
+
+def cache_status(config, op_id, etl_completed_at):
+    """Cache an op's completion time, which decides the lifetime of its cached results"""
+    etl_completed_at = etl_completed_at or ''
+    response_cache.set(cache_key(config_key(config), 'pentest_status', op_id), etl_completed_at,
+                       ttl_for_completion(etl_completed_at), group=config_key(config))
+    return etl_completed_at
+
+
+def op_cache_ttl(config, horizon, op_id):
+    """
+    Cache lifetime for an op's results, derived from (and cached with) its completion
+    time. When the completion time cannot be looked up, the short lifetime of a running
+    op is used so the results already fetched are not lost.
+    """
+    etl_completed_at = response_cache.get(cache_key(config_key(config), 'pentest_status', op_id))
+    if etl_completed_at is None:
+        try:
+            pentest = (horizon.make_request(PENTEST_STATUS_QUERY, {"op_id": op_id}) or {}).get('pentest') or {}
+        except Exception as e:
+            logger.warning(f"Could not look up the status of op {op_id}: {str(e)}")
+            return RUNNING_TTL
+        etl_completed_at = cache_status(config, op_id, pentest.get('etl_completed_at'))
+    return ttl_for_completion(etl_completed_at)
+
+
+def filter_page(result, page_key, records_key, plan):
+    """Apply the local part of a FilterPlan to the records of a single page result"""
+    page = (result or {}).get(page_key)
+    if plan is None or not plan.is_local or not page:
+        return result
+    page[records_key] = plan.finish(list(plan.apply(page.get(records_key) or [])))
+    return result
+
+
+def query_op(config, query, op_id, params, page_key, records_key, plan=None):
+    """
+    Run a per-op paged query for one op_id, following all pages when fetch_all is set.
+    Results are served from and stored in the response cache unless bypass_cache is set.
+    """
+    horizon = HorizonAPI(config)
+    variables = {
+        "input": {"op_id": op_id},
+        "page_input": build_page_input(params, plan)
+    }
+    use_cache = not params.get('bypass_cache')
+    if use_cache:
+        max_mb = safe_int(config.get('cache_max_mb'), None)
+        response_cache.resize(safe_int(config.get('cache_size'), DEFAULT_CACHE_SIZE),
+                              max_mb * 1024 * 1024 if max_mb else DEFAULT_CACHE_MAX_BYTES)
+        disk_dir = response_cache_dir(config)
+        key = cache_key(config_key(config), query, variables, bool(params.get('fetch_all')),
+                        params.get('max_records'), plan.local_key() if plan is not None else None)
+        cached = response_cache.get(key, disk_dir)
+        if cached is not None:
+            return cached
+
+    if params.get('fetch_all'):
+        result = fetch_all_pages(horizon, query, variables, page_key, records_key, params, plan=plan)
+    elif params.get('stream_response'):
+        result = filter_page(horizon.stream_request(query, variables, page_key, records_key), page_key, records_key,
+                             plan)
+    else:
+        result = filter_page(horizon.make_request(query, variables), page_key, records_key, plan)
+    if use_cache:
+        response_cache.set(key, result, op_cache_ttl(config, horizon, op_id), disk_dir, group=config_key(config))
+    return result
+
+
+async def fetch_ops_async(config, entity, fields, op_ids, params, plan=None):
+    """
+    Query several op_ids concurrently on one event loop through AsyncHorizonAPI, with up
+    to max_workers requests in flight. Returns op_id to result or error, like query_op.
+    """
+    page_key = ENTITIES[entity]['page_key']
+    query = op_page_query(entity, fields)
+    max_records = safe_int(params.get('max_records'), None)
+    client = AsyncHorizonAPI(config, safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS) or DEFAULT_MAX_WORKERS)
+
+    async def fetch(op_id):
+        variables = {"input": {"op_id": op_id}, "page_input": build_page_input(params, plan)}
+        try:
+            if not params.get('fetch_all'):
+                return filter_page(await client.make_request_async(query, variables), page_key, entity, plan)
+            records = []
+            async for record in client.paginate_async(query, variables, page_key, entity):
+                if plan is None or plan.matches(record):
+                    records.append(record)
+                    if max_records and len(records) >= max_records:
+                        break
+            if plan is not None:
+                records = plan.finish(records)
+            page_info = {"page_size": len(records), "total_count": len(records),
+                         "has_next_page": bool(max_records) and len(records) >= max_records}
+            return {page_key: {entity: records, "page_info": page_info}}
+        except Exception as e:
+            return e
+
+    try:
+        results = await asyncio.gather(*(fetch(op_id) for op_id in op_ids))
+    finally:
+        await client.aclose()
+    return dict(zip(op_ids, results))
+
+
+def fan_out_ops(config, entity, fields, op_ids, params, plan=None):
+    """
+    Run query_op for several op_ids on a bounded thread pool, or with batch_requests,
+    fetch the first page of many ops per request through aliased GraphQL queries.
+
+    Records are merged in the order the op_ids were given, and each op's outcome is
+    reported in op_results so one failing pentest does not hide the others.
+    """
+    page_key = ENTITIES[entity]['page_key']
+    records_key = entity
+    max_workers = max(1, min(safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS), len(op_ids)))
+    if params.get('batch_requests') and not params.get('fetch_all'):
+        outcomes = batch_op_pages(config, entity, fields, op_ids, build_page_input(params, plan), max_workers,
+                                  safe_int(params.get('max_batch_cost'), DEFAULT_MAX_BATCH_COST))
+        for op_id, outcome in outcomes.items():
+            if not isinstance(outcome, Exception):
+                filter_page(outcome, page_key, records_key, plan)
+    elif params.get('async_io'):
+        outcomes = run_sync(fetch_ops_async(config, entity, fields, op_ids, params, plan))
+    else:
+        query = op_page_query(entity, fields)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # each worker runs in a copy of the caller's context so metrics keep the operation name
+            futures = {op_id: executor.submit(contextvars.copy_context().run, query_op, config, query, op_id,
+                                              params, page_key, records_key, plan)
+                       for op_id in op_ids}
+        outcomes = {}
+        for op_id, future in futures.items():
+            try:
+                outcomes[op_id] = future.result()
+            except Exception as e:
+                outcomes[op_id] = e
+
+    records = []
+    op_results = []
+    for op_id in op_ids:
+        outcome = outcomes[op_id]
+        if isinstance(outcome, Exception):
+            logger.error(f"Error querying {page_key} for op {op_id}: {str(outcome)}")
+            op_results.append({"op_id": op_id, "status": "failed", "error": str(outcome)})
+            continue
+        page = (outcome or {}).get(page_key) or {}
+        op_records = page.get(records_key) or []
+        records.extend(op_records)
+        op_results.append({"op_id": op_id, "status": "success", "count": len(op_records)})
+
+    if not any(result['status'] == 'success' for result in op_results):
+        raise ConnectorError(f"All ops failed: {[result['error'] for result in op_results]}")
+    if plan is not None:
+        records = plan.finish(records)
+
+    result = {
+        page_key: {
+            records_key: records,
+            "page_info": {"page_size": len(records), "total_count": len(records)}
+        },
+        "op_results": op_results
+    }
+    if params.get('async_io') and not (params.get('batch_requests') and not params.get('fetch_all')):
+        result['async_transport'] = 'aiohttp' if async_available() else 'threads'
+    return result
+
+
 def get_pentests(config, params):
     try:
         horizon = HorizonAPI(config)
-        # Base fields that are always included
-        base_fields = """
-            op_id
-            op_type
-            name
-            state
-            user_name
-            client_name
-            min_scope
-            max_scope
-            exclude_scope
-            scheduled_at
-            launched_at
-            completed_at
-            canceled_at
-            etl_completed_at
-            duration_s
-            impacts_count
-            impact_paths_count
-            attack_paths_count
-            phished_impact_paths_count
-            phished_attack_paths_count
-            weakness_types_count
-            weaknesses_count
-            hosts_count
-            out_of_scope_hosts_count
-            external_domains_count
-            services_count
-            credentials_count
-            users_count
-            cred_access_count
-            data_stores_count
-            websites_count
-            data_resources_count
-            nodezero_script_url
-            nodezero_ip
-        """
-
-        # Optional attack paths fields
-        attack_paths_fields = """
-            attack_paths_page {
-                page_info {
-                    page_size
-                    end_cursor
-                }
-                attack_paths {
-                    uuid
-                    impact_type
-                    impact_title
-                    impact_description
-                    name
-                    attack_path_title
-                    base_score
-                    score
-                    severity
-                    context_score_description_md
-                    op_id
-                    weakness_refs
-                    credential_refs
-                    host_refs
-                    time_to_finding_hms
-                    time_to_finding_s
-                    created_at
-                    target_entity_text
-                    affected_asset_text
-                    ip
-                    host_name
-                    host_text
-                }
-            }
-        """ if params.get('include_attack_paths') else ""
-
-        # Optional weaknesses fields
-        weaknesses_fields = """
-            weaknesses_page {
-                page_info {
-                    page_size
-                    end_cursor
-                }
-                weaknesses {
-                    uuid
-                    created_at
-                    vuln_id
-                    vuln_aliases
-                    vuln_category
-                    vuln_name
-                    vuln_short_name
-                    vuln_cisa_kev
-                    vuln_known_ransomware_campaign_use
-                    op_id
-                    ip
-                    has_proof
-                    proof_failure_code
-                    proof_failure_reason
-                    score
-                    severity
-                    base_score
-                    base_severity
-                    context_score
-                    context_severity
-                    context_score_description_md
-                    context_score_description
-                    time_to_finding_hms
-                    time_to_finding_s
-                    affected_asset_text
-                    downstream_impact_types
-                    downstream_impact_types_and_counts
-                    impact_paths_count
-                    attack_paths_count
-                    diff_status
-                    mitre_mappings {
-                        mitre_tactic_id
-                        mitre_technique_id
-                        mitre_subtechnique_id
-                    }
-                }
+        pentest_fields = resolve_fields('pentests', params.get('fields'))
+        if params.get('incremental'):
+            # the watermark field is needed to advance the watermark
+            watermark_field = params.get('watermark_field') or DEFAULT_WATERMARK_FIELD
+            pentest_fields = resolve_fields('pentests', pentest_fields + (watermark_field,))
+        nested_fields = {
+            'attack_paths': resolve_fields('attack_paths', params.get('attack_path_fields'))
+            if params.get('include_attack_paths') else None,
+            'weaknesses': resolve_fields('weaknesses', params.get('weakness_fields'))
+            if params.get('include_weaknesses') else None
+        }
+        if params.get('expand_nested'):
+            # the nested counts tell how many follow-up pages each pentest needs
+            pentest_fields = resolve_fields('pentests', pentest_fields + tuple(
+                NESTED_COUNT_FIELDS[entity] for entity, fields in nested_fields.items() if fields))
+        query = pentests_query(pentest_fields, nested_fields['attack_paths'], nested_fields['weaknesses'])
+
+        if params.get('incremental'):
+            result = sync_pentests(config, horizon, query, params)
+        else:
+            variables = {
+                "page_input": build_page_input(params)
             }
-        """ if params.get('include_weaknesses') else ""
-
-        query = f"""
-        query pentests_page($page_input: PageInput) {{
-            pentests_page(page_input: $page_input) {{
-                pentests {{
-                    {base_fields}
-                    {attack_paths_fields}
-                    {weaknesses_fields}
-                }}
-                page_info {{
-                    page_size
-                    end_cursor
-                }}
-            }}
-        }}
-        """
+            if params.get('stream_response'):
+                result = horizon.stream_request(query, variables, 'pentests_page', 'pentests')
+            else:
+                result = horizon.make_request(query, variables)
+
+        if params.get('expand_nested'):
+            expand_nested_pages(config, result, nested_fields, params)
+        return result
+    except Exception as e:
+        logger.error(f"Error getting pentests: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def expand_nested_pages(config, result, nested_fields, params):
+    """
+    Complete the nested attack_paths_page / weaknesses_page of every pentest in result.
 
+    The first nested page is already embedded, so only pages 2..N are requested. N comes
+    from the pentest's attack_paths_count / weaknesses_count, which lets the follow-up
+    pages of all pentests run concurrently on one thread pool. When the last of those
+    pages comes back full the count may be stale, and the remaining pages of that
+    pentest are paged through afterwards.
+    """
+    pending = []
+    tasks = []
+    for pentest in (result.get('pentests_page') or {}).get('pentests') or []:
+        for entity, fields in nested_fields.items():
+            page = pentest.get(ENTITIES[entity]['page_key']) if fields else None
+            if not page:
+                continue
+            records = page.get(entity) or []
+            page_size = (page.get('page_info') or {}).get('page_size') or len(records)
+            if not records or len(records) < page_size:
+                continue
+            count = pentest.get(NESTED_COUNT_FIELDS[entity]) or 0
+            last_page = max(-(-count // page_size), 1)
+            pages = {}
+            pending.append((pentest, entity, page, page_size, last_page, pages))
+            tasks.extend((pentest['op_id'], entity, page_num, page_size, pages) for page_num in range(2, last_page + 1))
+
+    def fetch(op_id, entity, page_num, page_size):
         variables = {
-            "page_input": build_page_input(params)
+            "input": {"op_id": op_id},
+            "page_input": {"page_num": page_num, "page_size": page_size}
         }
+        response = HorizonAPI(config).make_request(op_page_query(entity, nested_fields[entity]), variables)
+        return ((response or {}).get(ENTITIES[entity]['page_key']) or {}).get(entity) or []
 
-        return horizon.make_request(query, variables)
+    errors = []
+    if tasks:
+        max_workers = max(1, min(safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS), len(tasks)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(task, executor.submit(contextvars.copy_context().run, fetch, *task[:4])) for task in tasks]
+        for (op_id, entity, page_num, _, pages), future in futures:
+            try:
+                pages[page_num] = future.result()
+            except Exception as e:
+                logger.error(f"Error expanding {entity} page {page_num} of op {op_id}: {str(e)}")
+                errors.append({"op_id": op_id, "entity": entity, "page_num": page_num, "error": str(e)})
+
+    for pentest, entity, page, page_size, last_page, pages in pending:
+        records = page.get(entity) or []
+        for page_num in range(2, last_page + 1):
+            records.extend(pages.get(page_num) or [])
+        # a full last page means the count may be stale, so paging goes on until a short page
+        last_page_full = len(records) == last_page * page_size
+        if last_page_full and not any(e['op_id'] == pentest['op_id'] for e in errors):
+            variables = {
+                "input": {"op_id": pentest['op_id']},
+                "page_input": {"page_num": last_page + 1, "page_size": page_size}
+            }
+            records.extend(HorizonAPI(config).paginate(
+                op_page_query(entity, nested_fields[entity]), variables, ENTITIES[entity]['page_key'], entity))
+        page[entity] = records
+        page['page_info'] = dict(page.get('page_info') or {}, total_count=len(records))
+
+    if errors:
+        result['expansion_errors'] = errors
+    return result
+
+
+def sync_pentests(config, horizon, query, params):
+    """
+    Return only the pentests whose watermark field moved past the stored high-watermark.
+
+    The stored watermark is not advanced here: the run's watermark is kept as pending
+    and only committed by commit_pentest_watermark once the pentests were delivered, so
+    a run whose delivery failed is repeated from the previous watermark on the next call.
+    """
+    field = params.get('watermark_field') or DEFAULT_WATERMARK_FIELD
+    if params.get('reset_watermark'):
+        def reset(state):
+            state = dict(state or {}, **{field: None})
+            state['pending'] = {key: value for key, value in (state.get('pending') or {}).items() if key != field}
+            return state
+        update_state(config, WATERMARK_STATE, reset, {})
+    previous = (load_state(config, WATERMARK_STATE, {}) or {}).get(field)
+
+    # always from the first page, the watermark advances past everything that was read
+    sync_params = dict(params, page_num=1, date_field=field, order_by=field, sort_order=SortOrder.ASC.value)
+    sync_params.pop('date_from', None)
+    if previous:
+        sync_params['date_from'] = previous
+    variables = {
+        "page_input": build_page_input(sync_params)
+    }
+
+    pentests = []
+    current = previous
+    for pentest in horizon.paginate(query, variables, 'pentests_page', 'pentests',
+                                    stream=bool(params.get('stream_response')), **paging_options(params)):
+        value = pentest.get(field)
+        if not value or (previous and value <= previous):
+            continue
+        pentests.append(pentest)
+        if not current or value > current:
+            current = value
+
+    if current and current != previous:
+        def hold(state):
+            state = state or {}
+            state['pending'] = dict(state.get('pending') or {}, **{field: current})
+            return state
+        update_state(config, WATERMARK_STATE, hold, {})
+    return {
+        "pentests_page": {
+            "pentests": pentests,
+            "page_info": {"page_size": len(pentests), "total_count": len(pentests)}
+        },
+        "watermark": {"field": field, "previous": previous, "current": current}
+    }
+
+
+def commit_pentest_watermark(config, params):
+    """
+    Advance the stored high-watermark of incremental get_pentests runs, acknowledging
+    that the pentests of a run were delivered. The watermark is the watermark.current
+    returned by that run; without one, the pending watermark of the latest run is used.
+    """
+    try:
+        field = params.get('watermark_field') or DEFAULT_WATERMARK_FIELD
+        state = load_state(config, WATERMARK_STATE, {}) or {}
+        watermark = str(params.get('watermark') or '').strip() or (state.get('pending') or {}).get(field)
+        if not watermark:
+            raise ConnectorError(f"No {field} watermark to commit, run an incremental Get Pentests first")
+
+        def advance(state):
+            state = state or {}
+            if not state.get(field) or watermark > state[field]:
+                state[field] = watermark
+            pending = state.get('pending') or {}
+            if pending.get(field) and pending[field] <= state[field]:
+                state['pending'] = {key: value for key, value in pending.items() if key != field}
+            return state
+
+        state = update_state(config, WATERMARK_STATE, advance, {})
+        return {"field": field, "watermark": state.get(field), "pending": (state.get('pending') or {}).get(field)}
     except Exception as e:
-        logger.error(f"Error getting pentests: {str(e)}")
+        logger.error(f"Error committing the pentest watermark: {str(e)}")
         raise ConnectorError(str(e))
 
 
 def get_attack_paths(config, params):
     try:
-        horizon = HorizonAPI(config)
-        op_id = params.get('op_id')
-        if not op_id:
+        op_ids = parse_op_ids(params.get('op_id'))
+        if not op_ids:
             raise ConnectorError("op_id is required")
 
-        query = """
-            query attack_paths_page($input: OpInput!, $page_input: PageInput) {
-              attack_paths_page(input: $input, page_input: $page_input) {
-                attack_paths {
-                    uuid
-                    impact_type
-                    impact_title
-                    impact_description
-                    name
-                    attack_path_title
-                    base_score
-                    score
-                    severity
-                    context_score_description_md
-                    op_id
-                    weakness_refs
-                    credential_refs
-                    host_refs
-                    time_to_finding_hms
-                    time_to_finding_s
-                    created_at
-                    target_entity_text
-                    affected_asset_text
-                    ip
-                    host_name
-                    host_text
-                }
-                page_info {
-                    page_size
-                    end_cursor
-                }
-            }
-        }
-        """
-
-        variables = {
-            "input": {"op_id": op_id},
-            "page_input": build_page_input(params)
-        }
+        plan = plan_filters('attack_paths', params)
+        fields = resolve_fields('attack_paths', params.get('fields'))
+        if plan.fields:
+            # locally filtered fields have to be selected
+            fields = resolve_fields('attack_paths', fields + plan.fields)
 
-        return horizon.make_request(query, variables)
+        if len(op_ids) == 1 and not isinstance(params.get('op_id'), (list, tuple)):
+            return query_op(config, op_page_query('attack_paths', fields), op_ids[0], params,
+                            'attack_paths_page', 'attack_paths', plan)
+        return fan_out_ops(config, 'attack_paths', fields, op_ids, params, plan)
     except Exception as e:
         logger.error(f"Error getting attack paths: {str(e)}")
         raise ConnectorError(str(e))
@@ -282,70 +556,509 @@ def get_attack_paths(config, params):
 
 def get_weaknesses(config, params):
     try:
-        horizon = HorizonAPI(config)
-        op_id = params.get('op_id')
-        if not op_id:
+        op_ids = parse_op_ids(params.get('op_id'))
+        if not op_ids:
             raise ConnectorError("op_id is required")
 
-        query = """
-        query weaknesses_page($input: OpInput!, $page_input: PageInput) {
-            weaknesses_page(input: $input, page_input: $page_input) {
-                weaknesses {
-                    uuid
-                    created_at
-                    vuln_id
-                    vuln_aliases
-                    vuln_category
-                    vuln_name
-                    vuln_short_name
-                    vuln_cisa_kev
-                    vuln_known_ransomware_campaign_use
-                    op_id
-                    ip
-                    has_proof
-                    proof_failure_code
-                    proof_failure_reason
-                    score
-                    severity
-                    base_score
-                    base_severity
-                    context_score
-                    context_severity
-                    context_score_description_md
-                    context_score_description
-                    time_to_finding_hms
-                    time_to_finding_s
-                    affected_asset_text
-                    downstream_impact_types
-                    downstream_impact_types_and_counts
-                    impact_paths_count
-                    attack_paths_count
-                    diff_status
-                    mitre_mappings {
-                        mitre_tactic_id
-                        mitre_technique_id
-                        mitre_subtechnique_id
-                    }
-                }
-                page_info {
-                    page_size
-                    end_cursor
-                }
-            }
-        }
-        """
+        plan = plan_filters('weaknesses', params)
+        fields = resolve_fields('weaknesses', params.get('fields'))
+        if plan.fields:
+            # locally filtered fields have to be selected
+            fields = resolve_fields('weaknesses', fields + plan.fields)
+
+        if len(op_ids) == 1 and not isinstance(params.get('op_id'), (list, tuple)):
+            return query_op(config, op_page_query('weaknesses', fields), op_ids[0], params,
+                            'weaknesses_page', 'weaknesses', plan)
+        return fan_out_ops(config, 'weaknesses', fields, op_ids, params, plan)
+    except Exception as e:
+        logger.error(f"Error getting weaknesses: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def list_pentests(horizon, fields=('op_id',)):
+    """Every pentest with the given fields, oldest first"""
+    variables = {"page_input": {"page_num": 1, "page_size": DEFAULT_EXPORT_PAGE_SIZE,
+                                "order_by": "launched_at", "sort_order": SortOrder.ASC.value}}
+    return list(horizon.paginate(pentests_query(fields), variables, 'pentests_page', 'pentests'))
 
+
+def list_op_ids(horizon):
+    """op_id of every pentest, oldest first"""
+    return [pentest['op_id'] for pentest in list_pentests(horizon)]
+
+
+def export_records(config, params, entity):
+    """
+    Write every record of an entity to a gzip NDJSON file, checkpointing after each page.
+
+    Weaknesses and attack paths are exported for the given op_ids, or for all pentests
+    when none are given. Calling again with the same parameters resumes an interrupted
+    export from its last checkpoint; a complete export is returned as is unless restart
+    is set. Returns a summary of the file instead of the records.
+    """
+    horizon = HorizonAPI(config)
+    page_key = ENTITIES[entity]['page_key']
+    page_size = safe_int(params.get('page_size'), DEFAULT_EXPORT_PAGE_SIZE) or DEFAULT_EXPORT_PAGE_SIZE
+    plan = plan_filters(entity, params) if entity != 'pentests' else None
+    fields = resolve_fields(entity, params.get('fields'))
+    if plan is not None and plan.fields:
+        fields = resolve_fields(entity, fields + plan.fields)
+    query = pentests_query(fields) if entity == 'pentests' else op_page_query(entity, fields)
+    page_params = dict(params, page_num=1, page_size=page_size)
+
+    job = cache_key(config_key(config), entity, parse_op_ids(params.get('op_id')), fields,
+                    build_page_input(page_params, plan), plan.local_key() if plan is not None else None,
+                    params.get('file_name'))
+    file_name = params.get('file_name') or f"{entity}-{job[:16]}.ndjson.gz"
+    export = NDJSONExport(config, job, os.path.basename(file_name), bool(params.get('restart')))
+    if export.complete:
+        return export.summary()
+
+    position = export.position or {"source": 0, "page_num": 1, "cursor": None}
+    if export.position is None:
+        if entity == 'pentests':
+            position['sources'] = [None]
+        else:
+            position['sources'] = parse_op_ids(params.get('op_id')) or list_op_ids(horizon)
+    sources = position['sources']
+    try:
+        for index in range(position['source'], len(sources)):
+            resuming = index == position['source']
+            page_num = position['page_num'] if resuming else 1
+            last_cursor = position['cursor'] if resuming else None
+            while True:
+                variables = {"page_input": build_page_input(dict(page_params, page_num=page_num), plan)}
+                if sources[index] is not None:
+                    variables['input'] = {"op_id": sources[index]}
+                page = (horizon.make_request(query, variables) or {}).get(page_key) or {}
+                records = page.get(entity) or []
+                page_info = page.get('page_info') or {}
+                cursor = page_info.get('end_cursor')
+                served = page_info.get('page_size')
+                if served and served < page_size:
+                    # the server caps the page size, a page is only short against the size it served
+                    logger.info(f"Server returned pages of {served} records, limiting the page size")
+                    page_size = served
+                repeated = bool(cursor) and cursor == last_cursor
+                done = repeated or len(records) < page_size
+                if repeated:
+                    records = []
+                elif plan is not None:
+                    records = list(plan.apply(records))
+                if done:
+                    following = {"source": index + 1, "page_num": 1, "cursor": None, "sources": sources}
+                else:
+                    following = {"source": index, "page_num": page_num + 1, "cursor": cursor, "sources": sources}
+                export.write_page(records, following)
+                if done:
+                    break
+                page_num += 1
+                last_cursor = cursor
+        export.finish()
+    finally:
+        export.close()
+    return export.summary()
+
+
+def export_pentests(config, params):
+    try:
+        return export_records(config, params, 'pentests')
+    except Exception as e:
+        logger.error(f"Error exporting pentests: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def export_attack_paths(config, params):
+    try:
+        return export_records(config, params, 'attack_paths')
+    except Exception as e:
+        logger.error(f"Error exporting attack paths: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def export_weaknesses(config, params):
+    try:
+        return export_records(config, params, 'weaknesses')
+    except Exception as e:
+        logger.error(f"Error exporting weaknesses: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def fetch_op_records(config, op_id, params):
+    """All weaknesses and attack paths of one op, for the local mirror"""
+    horizon = HorizonAPI(config)
+    records = {}
+    for entity in MIRROR_ENTITIES:
         variables = {
             "input": {"op_id": op_id},
-            "page_input": build_page_input(params)
+            "page_input": {"page_num": 1, "page_size": safe_int(params.get('page_size'), 100) or 100}
         }
+        # held as compact models while the op waits to be written
+        records[entity] = list(to_models(entity, horizon.paginate(
+            op_page_query(entity, ENTITIES[entity]['fields']), variables, ENTITIES[entity]['page_key'], entity,
+            **paging_options(params))))
+    return records
+
 
-        return horizon.make_request(query, variables)
+def sync_mirror(config, params):
+    """
+    Bring the local SQLite mirror up to date with the pentests whose post-processing
+    finished after the mirror's watermark. The weaknesses and attack paths of those ops
+    are fetched concurrently and replace the op's previous rows in one transaction. The
+    watermark only advances past ops that were stored, so failed ops are retried next time.
+    """
+    try:
+        horizon = HorizonAPI(config)
+        with Mirror.open(config) as mirror:
+            if params.get('rebuild'):
+                mirror.set_meta('watermark', None)
+            watermark = mirror.get_meta('watermark')
+            sync_params = {"date_field": DEFAULT_WATERMARK_FIELD, "order_by": DEFAULT_WATERMARK_FIELD,
+                           "sort_order": SortOrder.ASC.value, "page_size": 100}
+            if watermark:
+                sync_params['date_from'] = watermark
+            pentests = [pentest for pentest in horizon.paginate(
+                pentests_query(ENTITIES['pentests']['fields']), {"page_input": build_page_input(sync_params)},
+                'pentests_page', 'pentests')
+                if pentest.get(DEFAULT_WATERMARK_FIELD) and
+                (not watermark or pentest[DEFAULT_WATERMARK_FIELD] > watermark)]
+            pentests.sort(key=lambda pentest: pentest[DEFAULT_WATERMARK_FIELD])
+            mirror.upsert_pentests(pentests)
+
+            max_workers = max(1, min(safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS), len(pentests) or 1))
+            counts = {entity: 0 for entity in MIRROR_ENTITIES}
+            errors = []
+            failed = set()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [(pentest['op_id'], executor.submit(contextvars.copy_context().run, fetch_op_records,
+                                                              config, pentest['op_id'], params))
+                           for pentest in pentests]
+                for op_id, future in futures:
+                    try:
+                        records = future.result()
+                        mirror.replace_op(op_id, records['weaknesses'], records['attack_paths'])
+                    except Exception as e:
+                        logger.error(f"Error mirroring op {op_id}: {str(e)}")
+                        errors.append({"op_id": op_id, "error": str(e)})
+                        failed.add(op_id)
+                        continue
+                    for entity in MIRROR_ENTITIES:
+                        counts[entity] += len(records[entity])
+
+            new_watermark = watermark
+            for pentest in pentests:
+                if pentest['op_id'] in failed:
+                    break
+                new_watermark = pentest[DEFAULT_WATERMARK_FIELD]
+            if new_watermark != watermark:
+                mirror.set_meta('watermark', new_watermark)
+            return {
+                "synced_pentests": len(pentests) - len(failed),
+                "synced_weaknesses": counts['weaknesses'],
+                "synced_attack_paths": counts['attack_paths'],
+                "errors": errors,
+                "mirror": mirror.stats()
+            }
     except Exception as e:
-        logger.error(f"Error getting weaknesses: {str(e)}")
+        logger.error(f"Error syncing mirror: {str(e)}")
         raise ConnectorError(str(e))
 
 
+def lookup_weaknesses_by_ip(config, params):
+    try:
+        ip = str(params.get('ip') or '').strip()
+        if not ip:
+            raise ConnectorError("ip is required")
+        severity = [item.strip().upper() for item in str(params.get('severity') or '').split(',') if item.strip()]
+        with Mirror.open(config, create=False) as mirror:
+            weaknesses = mirror.weaknesses_by_ip(ip, severity, safe_int(params.get('limit'), None))
+        return {"ip": ip, "count": len(weaknesses), "weaknesses": weaknesses}
+    except Exception as e:
+        logger.error(f"Error looking up weaknesses by ip: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def lookup_ops_by_vuln(config, params):
+    try:
+        vuln_id = str(params.get('vuln_id') or '').strip()
+        if not vuln_id:
+            raise ConnectorError("vuln_id is required")
+        with Mirror.open(config, create=False) as mirror:
+            ops = mirror.ops_by_vuln(vuln_id)
+        return {"vuln_id": vuln_id, "count": len(ops), "ops": ops}
+    except Exception as e:
+        logger.error(f"Error looking up ops by vulnerability: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def aggregate_op(config, op_id, params):
+    """Rollup of the weaknesses of one op, counted page by page as they arrive"""
+    horizon = HorizonAPI(config)
+    variables = {
+        "input": {"op_id": op_id},
+        "page_input": {"page_num": 1, "page_size": safe_int(params.get('page_size'), 100) or 100}
+    }
+    return aggregate_weaknesses(horizon.paginate(op_page_query('weaknesses', SUMMARY_FIELDS), variables,
+                                                 'weaknesses_page', 'weaknesses', **paging_options(params)))
+
+
+def get_weakness_summary(config, params):
+    """
+    Weakness counts by vuln_id, severity, category, CISA KEV and MITRE technique across
+    the given pentests (all when no op_id is given), with a trend per launch period.
+
+    Each op's counts are kept in the state directory once its post-processing has
+    finished, so a rerun only fetches ops that completed, or were re-processed, since
+    the previous rollup. Ops that are still running are fetched every time.
+    """
+    try:
+        horizon = HorizonAPI(config)
+        op_ids = parse_op_ids(params.get('op_id'))
+        pentests = list_pentests(horizon, PREFETCH_FIELDS)
+        errors = []
+        if op_ids:
+            wanted = set(op_ids)
+            pentests = [pentest for pentest in pentests if pentest['op_id'] in wanted]
+            found = {pentest['op_id'] for pentest in pentests}
+            errors.extend({"op_id": op_id, "error": "Pentest not found"} for op_id in op_ids if op_id not in found)
+
+        rebuild = bool(params.get('rebuild'))
+        rollup = None if rebuild else load_state(config, ROLLUP_STATE)
+        cached = rollup['ops'] if rollup and rollup.get('version') == ROLLUP_VERSION else {}
+        aggregates = {}
+        stale = []
+        for pentest in pentests:
+            entry = cached.get(pentest['op_id'])
+            completed_at = pentest.get(DEFAULT_WATERMARK_FIELD)
+            if entry and completed_at and entry['etl_completed_at'] == completed_at:
+                aggregates[pentest['op_id']] = entry['aggregate']
+            else:
+                stale.append(pentest)
+
+        completed = {}
+        fetched = 0
+        max_workers = max(1, min(safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS), len(stale) or 1))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(pentest, executor.submit(contextvars.copy_context().run, aggregate_op,
+                                                 config, pentest['op_id'], params))
+                       for pentest in stale]
+            for pentest, future in futures:
+                try:
+                    aggregates[pentest['op_id']] = future.result()
+                except Exception as e:
+                    logger.error(f"Error aggregating weaknesses of op {pentest['op_id']}: {str(e)}")
+                    errors.append({"op_id": pentest['op_id'], "error": str(e)})
+                    continue
+                fetched += 1
+                if pentest.get(DEFAULT_WATERMARK_FIELD):
+                    completed[pentest['op_id']] = {"etl_completed_at": pentest[DEFAULT_WATERMARK_FIELD],
+                                                   "aggregate": aggregates[pentest['op_id']]}
+
+        listed = None if op_ids else {pentest['op_id'] for pentest in pentests}
+        if completed or rebuild or (listed is not None and set(cached).difference(listed)):
+            def merge(current):
+                ops = {} if rebuild or not current or current.get('version') != ROLLUP_VERSION else current['ops']
+                ops.update(completed)
+                if listed is not None:
+                    # pentests that no longer exist drop out of the rollup
+                    ops = {op_id: entry for op_id, entry in ops.items() if op_id in listed}
+                return {"version": ROLLUP_VERSION, "ops": ops}
+            update_state(config, ROLLUP_STATE, merge)
+
+        summary = summarize(aggregates, pentests, params.get('trend_interval') or 'month',
+                            safe_int(params.get('top_n'), DEFAULT_TOP_N))
+        summary['rollup'] = {
+            "cached_ops": len(pentests) - len(stale),
+            "fetched_ops": fetched,
+            "errors": errors
+        }
+        return summary
+    except Exception as e:
+        logger.error(f"Error summarizing weaknesses: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def stream_op(config, entity, op_id, fields, params):
+    """Records of one op, fetched page by page as they are consumed"""
+    variables = {
+        "input": {"op_id": op_id},
+        "page_input": {"page_num": 1, "page_size": safe_int(params.get('page_size'), DEFAULT_EXPORT_PAGE_SIZE) or
+                       DEFAULT_EXPORT_PAGE_SIZE}
+    }
+    return HorizonAPI(config).paginate(op_page_query(entity, fields), variables, ENTITIES[entity]['page_key'],
+                                       entity, **paging_options(params))
+
+
+def diff_op_entity(config, entity, baseline_op_id, retest_op_id, params):
+    fields = resolve_fields(entity, DIFF_FIELDS[entity])
+    return diff_findings(entity, stream_op(config, entity, baseline_op_id, fields, params),
+                         stream_op(config, entity, retest_op_id, fields, params),
+                         safe_int(params.get('max_findings'), DEFAULT_MAX_FINDINGS))
+
+
+def diff_pentests(config, params):
+    """
+    Compare the weaknesses and attack paths of a retest with those of a baseline
+    pentest, reporting findings that are new in the retest, fixed since the baseline
+    and persisting in both. Both entities are compared concurrently.
+    """
+    try:
+        baseline_op_id = str(params.get('baseline_op_id') or '').strip()
+        retest_op_id = str(params.get('retest_op_id') or '').strip()
+        if not baseline_op_id or not retest_op_id:
+            raise ConnectorError("baseline_op_id and retest_op_id are required")
+        entities = ['weaknesses']
+        if params.get('include_attack_paths', True):
+            entities.append('attack_paths')
+        with ThreadPoolExecutor(max_workers=len(entities)) as executor:
+            futures = {entity: executor.submit(contextvars.copy_context().run, diff_op_entity,
+                                               config, entity, baseline_op_id, retest_op_id, params)
+                       for entity in entities}
+            result = {"baseline_op_id": baseline_op_id, "retest_op_id": retest_op_id}
+            result.update((entity, future.result()) for entity, future in futures.items())
+        return result
+    except Exception as e:
+        logger.error(f"Error comparing pentests: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def fetch_weaknesses_by_uuid(config, op_id, uuids, fields):
+    """
+    Weaknesses of an op with the given uuids, in one request. uuid is not among the
+    documented filter fields, so the returned weaknesses are checked against the
+    requested uuids; None is returned when the server ignored the filter.
+    """
+    variables = {
+        "input": {"op_id": op_id},
+        "page_input": {"page_num": 1, "page_size": len(uuids),
+                       "filter_by_inputs": [{"field_name": "uuid", "values": uuids}]}
+    }
+    result = HorizonAPI(config).make_request(op_page_query('weaknesses', fields), variables) or {}
+    weaknesses = (result.get('weaknesses_page') or {}).get('weaknesses') or []
+    requested = set(uuids)
+    unexpected = sum(weakness.get('uuid') not in requested for weakness in weaknesses)
+    if unexpected:
+        logger.warning(f"The API did not filter weaknesses by uuid: {unexpected} of the {len(weaknesses)} "
+                       f"weaknesses returned for op {op_id} were not requested")
+        return None
+    return weaknesses
+
+
+def get_attack_path_graph(config, params):
+    """
+    Attack paths of an op as a graph with their referenced weaknesses, credentials and
+    hosts resolved. References are collected over all pages and deduplicated first, and
+    the weaknesses are then fetched in chunks of REF_CHUNK_SIZE uuids per request. When
+    the server ignores the uuid filter, the weaknesses of the op are paged through once
+    instead and the referenced ones picked from them.
+    """
+    try:
+        op_id = str(params.get('op_id') or '').strip()
+        if not op_id:
+            raise ConnectorError("op_id is required")
+        plan = plan_filters('attack_paths', params)
+        fields = resolve_fields('attack_paths', resolve_fields('attack_paths', params.get('fields') or 'minimal') +
+                                GRAPH_FIELDS + plan.fields)
+        weakness_fields = resolve_fields('weaknesses', params.get('weakness_fields') or 'minimal')
+        weakness_fields = resolve_fields('weaknesses', weakness_fields + ('uuid',))
+
+        graph = AttackPathGraph()
+        variables = {"input": {"op_id": op_id}, "page_input": build_page_input(dict(params, page_num=1), plan)}
+        paths = HorizonAPI(config).paginate(op_page_query('attack_paths', fields), variables, 'attack_paths_page',
+                                            'attack_paths', **paging_options(params))
+        for path in plan.apply(paths, safe_int(params.get('max_records'), None)):
+            graph.add_path(path)
+
+        chunks = chunked(graph.unresolved())
+        max_workers = max(1, min(safe_int(params.get('max_workers'), DEFAULT_MAX_WORKERS), len(chunks) or 1))
+        lookup = 'uuid_filter'
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, fetch_weaknesses_by_uuid,
+                                       config, op_id, chunk, weakness_fields) for chunk in chunks]
+            for future in futures:
+                weaknesses = future.result()
+                if weaknesses is None:
+                    lookup = 'op_scan'
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                graph.resolve(weaknesses)
+        if lookup == 'op_scan':
+            variables = {"input": {"op_id": op_id}, "page_input": {"page_num": 1, "page_size": DEFAULT_MAX_PAGE_SIZE}}
+            graph.resolve(HorizonAPI(config).paginate(op_page_query('weaknesses', weakness_fields), variables,
+                                                      'weaknesses_page', 'weaknesses', **paging_options(params)))
+        return dict(graph.to_dict(), op_id=op_id, weakness_lookup=lookup)
+    except Exception as e:
+        logger.error(f"Error building attack path graph: {str(e)}")
+        raise ConnectorError(str(e))
+
+
+def get_cache_stats(config, params):
+    return response_cache.stats()
+
+
+def get_rate_limit_status(config, params):
+    """Limiter of this configuration's server, plus the limiters of every server in use"""
+    return dict(HorizonAPI(config).limiter.stats(), servers=limiter_stats())
+
+
+def get_connector_metrics(config, params):
+    if params.get('reset'):
+        metrics.reset()
+        return {"reset": True}
+    if params.get('format') == 'prometheus':
+        return {"prometheus": metrics.prometheus()}
+    snapshot = metrics.snapshot()
+    snapshot['cache'] = response_cache.stats()
+    snapshot['rate_limit'] = HorizonAPI(config).limiter.stats()
+    return snapshot
+
+
+def get_payload_profile(config, params):
+    if params.get('reset'):
+        payload_profiler.reset()
+        return {"reset": True}
+    return {
+        "sample_rate": HorizonAPI(config).profile_rate,
+        "operations": payload_profiler.snapshot(params.get('graphql_operation') or None,
+                                                safe_int(params.get('top_n'), None))
+    }
+
+
+def warm_up(config):
+    """
+    Authenticate and open a pooled connection for a configuration, and with
+    prefetch_pentests, cache the completion times of the latest pentests so the first
+    per-op queries do not need a status lookup.
+    """
+    horizon = HorizonAPI(config)
+    horizon.check_health()
+    if not config.get('prefetch_pentests'):
+        return 0
+    variables = {"page_input": {"page_num": 1, "page_size": PREFETCH_PAGE_SIZE,
+                                "order_by": "launched_at", "sort_order": SortOrder.DESC.value}}
+    page = (horizon.make_request(pentests_query(PREFETCH_FIELDS), variables) or {}).get('pentests_page') or {}
+    pentests = page.get('pentests') or []
+    for pentest in pentests:
+        cache_status(config, pentest.get('op_id'), pentest.get('etl_completed_at'))
+    return len(pentests)
+
+
+def release_config(config):
+    """Drop the token, pooled session and cached responses of a configuration"""
+    key = config_key(config)
+    token_cache.invalidate(key)
+    close_sessions(config)
+    response_cache.invalidate_group(key, response_cache_dir(config))
+
+
+def release_all():
+    """Drop every token, pooled session and in-memory cached response"""
+    token_cache.clear()
+    close_sessions()
+    response_cache.clear()
+
+
 def health_check(config):
     try:
         horizon = HorizonAPI(config)
@@ -357,7 +1070,21 @@ def health_check(config):
 
 operations = {
     'get_pentests': get_pentests,
+    'commit_pentest_watermark': commit_pentest_watermark,
     'get_attack_paths': get_attack_paths,
     'get_weaknesses': get_weaknesses,
+    'export_pentests': export_pentests,
+    'export_attack_paths': export_attack_paths,
+    'export_weaknesses': export_weaknesses,
+    'sync_mirror': sync_mirror,
+    'lookup_weaknesses_by_ip': lookup_weaknesses_by_ip,
+    'lookup_ops_by_vuln': lookup_ops_by_vuln,
+    'get_weakness_summary': get_weakness_summary,
+    'diff_pentests': diff_pentests,
+    'get_attack_path_graph': get_attack_path_graph,
+    'get_cache_stats': get_cache_stats,
+    'get_rate_limit_status': get_rate_limit_status,
+    'get_connector_metrics': get_connector_metrics,
+    'get_payload_profile': get_payload_profile,
     'check_health': health_check
 }
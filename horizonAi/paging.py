@@ -0,0 +1,93 @@
+import re
+
+# Budget per page request the adaptive page size converges to
+TARGET_PAGE_BYTES = 4 * 1024 * 1024
+TARGET_PAGE_SECONDS = 5.0
+# Pages above the server's own page size limit would be truncated, so stay conservative
+DEFAULT_MAX_PAGE_SIZE = 256
+MIN_PAGE_SIZE = 1
+# A page is only grown when it used less than half of the budget, and shrunk above this
+SHRINK_THRESHOLD = 1.4
+
+# GraphQL errors that mean the requested page was too large or too slow to produce. Throttling
+# errors ("rate limit exceeded", "too many requests") must not match, a smaller page retried at
+# once does not help there
+SIZE_ERROR = re.compile(r'too large|max\w*\W+page|page size|complexity|timed? ?out|timeout', re.I)
+
+
+def floor_power_of_two(value):
+    return 1 << (max(int(value), 1).bit_length() - 1)
+
+
+class PageSizer:
+    """
+    Chooses the page_size of each request of a page_num paginated pull.
+
+    Sizes are powers of two and a size is only used where the current record offset is
+    a multiple of it, so page_num = offset / page_size + 1 always addresses exactly the
+    next unread record. After each page the size is doubled while the page used less
+    than half of the byte and latency budget, and halved when it went over it.
+    """
+
+    def __init__(self, page_size, offset=0, max_page_size=DEFAULT_MAX_PAGE_SIZE,
+                 target_bytes=TARGET_PAGE_BYTES, target_seconds=TARGET_PAGE_SECONDS):
+        self.max_page_size = floor_power_of_two(max_page_size)
+        self.size = min(floor_power_of_two(page_size), self.max_page_size)
+        self.offset = offset
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        while self.offset % self.size:
+            self.size //= 2
+        self.sizes = []
+
+    @property
+    def page_num(self):
+        return self.offset // self.size + 1
+
+    def _usage(self, response_bytes, seconds):
+        """Fraction of the budget a page used: the larger of its byte and latency share"""
+        usage = seconds / self.target_seconds if self.target_seconds else 0.0
+        if response_bytes and self.target_bytes:
+            usage = max(usage, response_bytes / self.target_bytes)
+        return usage
+
+    def advance(self, response_bytes, seconds):
+        """Move past a complete page and pick the size of the next one"""
+        self.sizes.append(self.size)
+        self.offset += self.size
+        usage = self._usage(response_bytes, seconds)
+        if usage > SHRINK_THRESHOLD and self.size > MIN_PAGE_SIZE:
+            self.size //= 2
+            return
+        while (usage and usage < 0.5 and self.size * 2 <= self.max_page_size
+               and self.offset % (self.size * 2) == 0):
+            self.size *= 2
+            usage *= 2
+
+    def shrink(self, done=0):
+        """
+        Halve the size after a failed page. done is the number of records of the failed
+        page that were already consumed; whole pages of the new size among them are
+        skipped and the rest returned as the number of records to drop from the retry.
+        Returns None when the size cannot be reduced any further.
+        """
+        if self.size <= MIN_PAGE_SIZE:
+            return None
+        self.max_page_size = self.size // 2
+        self.size //= 2
+        skipped = done // self.size * self.size
+        self.offset += skipped
+        return done - skipped
+
+    def cap(self, server_size, done=0):
+        """
+        Lower the maximum to what the server actually returns per page. done works as
+        for shrink(), for a capped page whose records were already consumed.
+        """
+        self.max_page_size = max(floor_power_of_two(server_size), MIN_PAGE_SIZE)
+        self.size = min(self.size, self.max_page_size)
+        while self.offset % self.size:
+            self.size //= 2
+        skipped = done // self.size * self.size
+        self.offset += skipped
+        return done - skipped
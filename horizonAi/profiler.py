@@ -0,0 +1,127 @@
+import json
+import random
+import threading
+import time
+
+DEFAULT_PROFILE_SAMPLE_RATE = 0.1
+
+
+class PayloadSample:
+    """
+    Field statistics of one sampled response, merged into the profiler on close().
+
+    Every value is attributed to its field path (list items get a [] suffix), with the
+    bytes of its JSON encoding including the key, whether it was null, and for leaf
+    values the time it takes to decode them. Leaf values of a path are decoded together
+    at close() so the timer overhead does not dominate small values.
+    """
+
+    def __init__(self, profiler, graphql_operation):
+        self.profiler = profiler
+        self.graphql_operation = graphql_operation
+        self.paths = {}
+        self.leaves = {}
+
+    def add(self, value, path=''):
+        self._walk(value, path, 0)
+
+    def _walk(self, value, path, key_bytes):
+        if isinstance(value, dict):
+            size = 1 + max(len(value), 1)
+            for key, child in value.items():
+                # "key": plus the child
+                size += self._walk(child, f"{path}.{key}" if path else key, len(key.encode('utf-8')) + 3)
+        elif isinstance(value, list):
+            size = 1 + max(len(value), 1)
+            for item in value:
+                size += self._walk(item, path + '[]', 0)
+        else:
+            encoded = json.dumps(value, ensure_ascii=False)
+            size = len(encoded.encode('utf-8'))
+            self.leaves.setdefault(path, []).append(encoded)
+        size += key_bytes
+        if path:
+            stats = self.paths.get(path)
+            if stats is None:
+                stats = self.paths[path] = [0, 0, 0]
+            stats[0] += size
+            stats[1] += 1
+            stats[2] += value is None
+        return size
+
+    def close(self, response_bytes):
+        decode_seconds = {}
+        for path, encoded in self.leaves.items():
+            text = '[' + ','.join(encoded) + ']'
+            started = time.perf_counter()
+            json.loads(text)
+            decode_seconds[path] = time.perf_counter() - started
+        self.profiler.merge(self.graphql_operation, self.paths, decode_seconds, response_bytes)
+
+
+class PayloadProfiler:
+    """Process-wide byte share, decode time and null rate per GraphQL field path of sampled responses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def start(self, graphql_operation, rate):
+        """A PayloadSample for this response when it is sampled at the given rate, else None"""
+        if rate <= 0 or random.random() >= rate:
+            return None
+        return PayloadSample(self, graphql_operation)
+
+    def merge(self, graphql_operation, paths, decode_seconds, response_bytes):
+        with self._lock:
+            totals = self._operations.setdefault(graphql_operation, {"samples": 0, "response_bytes": 0, "paths": {}})
+            totals['samples'] += 1
+            totals['response_bytes'] += response_bytes
+            for path, (size, count, nulls) in paths.items():
+                stats = totals['paths'].setdefault(path, [0, 0, 0, 0.0])
+                stats[0] += size
+                stats[1] += count
+                stats[2] += nulls
+                stats[3] += decode_seconds.get(path, 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def snapshot(self, graphql_operation=None, top_n=None):
+        """
+        Per GraphQL operation, its field paths ordered by total bytes. Decode time of an
+        object or list path is the sum over the leaf paths below it.
+        """
+        with self._lock:
+            operations = {name: {"samples": totals['samples'], "response_bytes": totals['response_bytes'],
+                                 "paths": {path: list(stats) for path, stats in totals['paths'].items()}}
+                          for name, totals in self._operations.items()
+                          if graphql_operation in (None, name)}
+        report = {}
+        for name, totals in sorted(operations.items()):
+            paths = totals['paths']
+            fields = []
+            for path, (size, count, nulls, _) in paths.items():
+                decode_seconds = sum(stats[3] for child, stats in paths.items()
+                                     if child == path or child.startswith(path + '.') or
+                                     child.startswith(path + '['))
+                fields.append({
+                    "path": path,
+                    "bytes": size,
+                    "byte_share": round(size / totals['response_bytes'], 4) if totals['response_bytes'] else None,
+                    "mean_bytes": round(size / count, 1),
+                    "decode_seconds": round(decode_seconds, 6),
+                    "count": count,
+                    "null_rate": round(nulls / count, 4)
+                })
+            fields.sort(key=lambda field: field['bytes'], reverse=True)
+            report[name] = {
+                "samples": totals['samples'],
+                "response_bytes": totals['response_bytes'],
+                "fields": fields[:top_n] if top_n else fields
+            }
+        return report
+
+
+payload_profiler = PayloadProfiler()
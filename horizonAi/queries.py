@@ -0,0 +1,247 @@
+from functools import lru_cache
+
+from connectors.core.connector import ConnectorError
+
+PENTEST_FIELDS = (
+    'op_id',
+    'op_type',
+    'name',
+    'state',
+    'user_name',
+    'client_name',
+    'min_scope',
+    'max_scope',
+    'exclude_scope',
+    'scheduled_at',
+    'launched_at',
+    'completed_at',
+    'canceled_at',
+    'etl_completed_at',
+    'duration_s',
+    'impacts_count',
+    'impact_paths_count',
+    'attack_paths_count',
+    'phished_impact_paths_count',
+    'phished_attack_paths_count',
+    'weakness_types_count',
+    'weaknesses_count',
+    'hosts_count',
+    'out_of_scope_hosts_count',
+    'external_domains_count',
+    'services_count',
+    'credentials_count',
+    'users_count',
+    'cred_access_count',
+    'data_stores_count',
+    'websites_count',
+    'data_resources_count',
+    'nodezero_script_url',
+    'nodezero_ip',
+)
+
+ATTACK_PATH_FIELDS = (
+    'uuid',
+    'impact_type',
+    'impact_title',
+    'impact_description',
+    'name',
+    'attack_path_title',
+    'base_score',
+    'score',
+    'severity',
+    'context_score_description_md',
+    'op_id',
+    'weakness_refs',
+    'credential_refs',
+    'host_refs',
+    'time_to_finding_hms',
+    'time_to_finding_s',
+    'created_at',
+    'target_entity_text',
+    'affected_asset_text',
+    'ip',
+    'host_name',
+    'host_text',
+)
+
+WEAKNESS_FIELDS = (
+    'uuid',
+    'created_at',
+    'vuln_id',
+    'vuln_aliases',
+    'vuln_category',
+    'vuln_name',
+    'vuln_short_name',
+    'vuln_cisa_kev',
+    'vuln_known_ransomware_campaign_use',
+    'op_id',
+    'ip',
+    'has_proof',
+    'proof_failure_code',
+    'proof_failure_reason',
+    'score',
+    'severity',
+    'base_score',
+    'base_severity',
+    'context_score',
+    'context_severity',
+    'context_score_description_md',
+    'context_score_description',
+    'time_to_finding_hms',
+    'time_to_finding_s',
+    'affected_asset_text',
+    'downstream_impact_types',
+    'downstream_impact_types_and_counts',
+    'impact_paths_count',
+    'attack_paths_count',
+    'diff_status',
+    'mitre_mappings',
+)
+
+# Fields that are objects and need a sub-selection
+SUBSELECTIONS = {
+    'mitre_mappings': ('mitre_tactic_id', 'mitre_technique_id', 'mitre_subtechnique_id'),
+}
+
+ENTITIES = {
+    'pentests': {
+        'page_key': 'pentests_page',
+        'fields': PENTEST_FIELDS,
+        'presets': {
+            'minimal': ('op_id', 'op_type', 'name', 'state', 'client_name', 'launched_at', 'completed_at',
+                        'etl_completed_at'),
+            'triage': ('op_id', 'op_type', 'name', 'state', 'user_name', 'client_name', 'scheduled_at',
+                       'launched_at', 'completed_at', 'canceled_at', 'etl_completed_at', 'duration_s',
+                       'impacts_count', 'impact_paths_count', 'attack_paths_count', 'weakness_types_count',
+                       'weaknesses_count', 'hosts_count', 'credentials_count'),
+        },
+    },
+    'attack_paths': {
+        'page_key': 'attack_paths_page',
+        'fields': ATTACK_PATH_FIELDS,
+        'presets': {
+            'minimal': ('uuid', 'op_id', 'name', 'impact_type', 'severity', 'score', 'created_at'),
+            'triage': ('uuid', 'op_id', 'name', 'impact_type', 'impact_title', 'attack_path_title', 'base_score',
+                       'score', 'severity', 'weakness_refs', 'credential_refs', 'host_refs', 'time_to_finding_s',
+                       'created_at', 'target_entity_text', 'affected_asset_text', 'ip', 'host_name'),
+        },
+    },
+    'weaknesses': {
+        'page_key': 'weaknesses_page',
+        'fields': WEAKNESS_FIELDS,
+        'presets': {
+            'minimal': ('uuid', 'op_id', 'vuln_id', 'vuln_name', 'ip', 'severity', 'score', 'created_at'),
+            'triage': ('uuid', 'created_at', 'vuln_id', 'vuln_category', 'vuln_name', 'vuln_short_name',
+                       'vuln_cisa_kev', 'vuln_known_ransomware_campaign_use', 'op_id', 'ip', 'has_proof', 'score',
+                       'severity', 'base_severity', 'context_severity', 'affected_asset_text',
+                       'impact_paths_count', 'attack_paths_count', 'diff_status', 'mitre_mappings'),
+        },
+    },
+}
+
+DEFAULT_PRESET = 'full'
+
+PENTEST_STATUS_QUERY = """
+        query pentest($op_id: String!) {
+            pentest(op_id: $op_id) {
+                op_id
+                state
+                etl_completed_at
+            }
+        }
+        """
+
+
+def resolve_fields(entity, fields=None):
+    """
+    Resolve a field selection to a tuple of field names in canonical order.
+
+    fields may be a preset name (minimal, triage, full), a comma separated string or a
+    list of field names. Canonical ordering makes equal selections share a cached query.
+    """
+    spec = ENTITIES[entity]
+    if not fields:
+        fields = DEFAULT_PRESET
+    if isinstance(fields, str):
+        if fields.strip() == 'full':
+            return spec['fields']
+        if fields.strip() in spec['presets']:
+            return spec['presets'][fields.strip()]
+        fields = fields.split(',')
+    requested = {str(field).strip() for field in fields if str(field).strip()}
+    unknown = requested.difference(spec['fields'])
+    if unknown:
+        raise ConnectorError(f"Unknown {entity} fields: {', '.join(sorted(unknown))}")
+    if not requested:
+        raise ConnectorError(f"No {entity} fields selected")
+    return tuple(field for field in spec['fields'] if field in requested)
+
+
+def _selection(fields, indent):
+    pad = ' ' * indent
+    lines = []
+    for field in fields:
+        if field in SUBSELECTIONS:
+            lines.append(f"{pad}{field} {{")
+            lines.extend(f"{pad}    {sub_field}" for sub_field in SUBSELECTIONS[field])
+            lines.append(f"{pad}}}")
+        else:
+            lines.append(f"{pad}{field}")
+    return '\n'.join(lines)
+
+
+def _page_selection(entity, fields, indent):
+    pad = ' ' * indent
+    return (f"{pad}{ENTITIES[entity]['page_key']} {{\n"
+            f"{pad}    page_info {{\n"
+            f"{pad}        page_size\n"
+            f"{pad}        end_cursor\n"
+            f"{pad}    }}\n"
+            f"{pad}    {entity} {{\n"
+            f"{_selection(fields, indent + 8)}\n"
+            f"{pad}    }}\n"
+            f"{pad}}}")
+
+
+@lru_cache(maxsize=256)
+def pentests_query(fields, attack_path_fields=None, weakness_fields=None):
+    """
+    Build the pentests_page query for a resolved field tuple. Nested attack path and
+    weakness pages are included when their field tuples are given.
+    """
+    nested = [_page_selection(entity, nested_fields, 20)
+              for entity, nested_fields in (('attack_paths', attack_path_fields), ('weaknesses', weakness_fields))
+              if nested_fields]
+    selection = '\n'.join([_selection(fields, 20)] + nested)
+    return f"""
+        query pentests_page($page_input: PageInput) {{
+            pentests_page(page_input: $page_input) {{
+                pentests {{
+{selection}
+                }}
+                page_info {{
+                    page_size
+                    end_cursor
+                }}
+            }}
+        }}
+        """
+
+
+@lru_cache(maxsize=256)
+def op_page_query(entity, fields):
+    """Build the per-op attack_paths_page or weaknesses_page query for a resolved field tuple"""
+    page_key = ENTITIES[entity]['page_key']
+    return f"""
+        query {page_key}($input: OpInput!, $page_input: PageInput) {{
+            {page_key}(input: $input, page_input: $page_input) {{
+                {entity} {{
+{_selection(fields, 20)}
+                }}
+                page_info {{
+                    page_size
+                    end_cursor
+                }}
+            }}
+        }}
+        """
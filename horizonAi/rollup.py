@@ -0,0 +1,107 @@
+from collections import Counter
+from datetime import date
+
+from connectors.core.connector import ConnectorError
+
+ROLLUP_STATE = 'weakness_rollup'
+ROLLUP_VERSION = 1
+DEFAULT_TOP_N = 25
+TREND_INTERVALS = ('day', 'week', 'month', 'year')
+
+# Weakness fields needed for the rollup
+SUMMARY_FIELDS = ('vuln_id', 'vuln_category', 'vuln_cisa_kev', 'severity', 'mitre_mappings')
+
+# Counted dimensions and the output key they are reported under
+DIMENSIONS = {
+    'vuln_id': 'by_vuln_id',
+    'severity': 'by_severity',
+    'vuln_category': 'by_vuln_category',
+    'vuln_cisa_kev': 'by_vuln_cisa_kev',
+    'mitre_technique': 'by_mitre_technique',
+}
+
+# Dimensions with many distinct values, cut to the top_n most frequent
+LONG_TAIL = ('vuln_id', 'mitre_technique')
+
+
+def _label(value):
+    if value is None:
+        return 'unknown'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def aggregate_weaknesses(weaknesses):
+    """
+    Count the weaknesses of one op per dimension in a single pass, without keeping
+    the records. A weakness mapped to several MITRE techniques counts once for each.
+    """
+    counters = {dimension: Counter() for dimension in DIMENSIONS}
+    vuln_ids, severities, categories, kev = (counters['vuln_id'], counters['severity'],
+                                             counters['vuln_category'], counters['vuln_cisa_kev'])
+    techniques = counters['mitre_technique']
+    total = 0
+    for weakness in weaknesses:
+        total += 1
+        vuln_ids[_label(weakness.get('vuln_id'))] += 1
+        severities[_label(weakness.get('severity'))] += 1
+        categories[_label(weakness.get('vuln_category'))] += 1
+        kev[_label(weakness.get('vuln_cisa_kev'))] += 1
+        techniques.update({_label(mapping.get('mitre_technique_id'))
+                           for mapping in weakness.get('mitre_mappings') or () if mapping})
+    aggregate = {dimension: dict(counter) for dimension, counter in counters.items()}
+    aggregate['weaknesses'] = total
+    return aggregate
+
+
+def period(timestamp, interval):
+    """Trend bucket of an ISO 8601 timestamp"""
+    if not timestamp:
+        return 'unknown'
+    if interval == 'day':
+        return timestamp[:10]
+    if interval == 'month':
+        return timestamp[:7]
+    if interval == 'year':
+        return timestamp[:4]
+    year, week, _ = date.fromisoformat(timestamp[:10]).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _ranked(counter, top_n=None):
+    items = counter.most_common(top_n or None)
+    return {value: count for value, count in items}
+
+
+def summarize(aggregates, pentests, interval='month', top_n=DEFAULT_TOP_N):
+    """
+    Merge per-op aggregates into totals per dimension and a trend per period of the
+    pentests' launch time. aggregates maps op_id to the output of aggregate_weaknesses.
+    """
+    if interval not in TREND_INTERVALS:
+        raise ConnectorError(f"trend_interval must be one of {', '.join(TREND_INTERVALS)}")
+    totals = {dimension: Counter() for dimension in DIMENSIONS}
+    trend = {}
+    weaknesses = 0
+    for pentest in pentests:
+        aggregate = aggregates.get(pentest['op_id'])
+        if aggregate is None:
+            continue
+        for dimension, counter in totals.items():
+            counter.update(aggregate[dimension])
+        weaknesses += aggregate['weaknesses']
+
+        bucket = trend.setdefault(period(pentest.get('launched_at'), interval),
+                                  {"pentests": 0, "weaknesses": 0, "cisa_kev": 0, "severity": Counter()})
+        bucket['pentests'] += 1
+        bucket['weaknesses'] += aggregate['weaknesses']
+        bucket['cisa_kev'] += aggregate['vuln_cisa_kev'].get('true', 0)
+        bucket['severity'].update(aggregate['severity'])
+
+    summary = {"pentests": sum(bucket['pentests'] for bucket in trend.values()), "weaknesses": weaknesses}
+    for dimension, key in DIMENSIONS.items():
+        summary[key] = _ranked(totals[dimension], top_n if dimension in LONG_TAIL else None)
+    summary['trend'] = [dict(bucket, period=name, severity=_ranked(bucket['severity']))
+                        for name, bucket in sorted(trend.items())]
+    return summary
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from connectors.core.connector import get_logger
+
+from .horizon_api_auth import config_key
+
+logger = get_logger('horizon-ai')
+
+DEFAULT_STATE_DIR = os.path.join(tempfile.gettempdir(), 'horizonAi')
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def state_dir(config):
+    """Directory holding the connector's local state files"""
+    path = config.get('state_dir') or DEFAULT_STATE_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def state_path(config, name, suffix='.json'):
+    """Path of a named state file, scoped to the server URL and API key of the config"""
+    digest = hashlib.sha256(config_key(config).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(state_dir(config), f"{name}-{digest}{suffix}")
+
+
+def _lock_for(path):
+    with _locks_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = threading.Lock()
+        return lock
+
+
+def load_state(config, name, default=None):
+    """Load a named state document, returning default if it does not exist or is unreadable"""
+    path = state_path(config, name)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state file {path}: {str(e)}")
+        return default
+
+
+def save_state(config, name, data):
+    """Atomically replace a named state document"""
+    path = state_path(config, name)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def update_state(config, name, updater, default=None):
+    """
+    Read-modify-write a named state document under a per-file lock.
+    updater receives the current document and returns the new one.
+    """
+    with _lock_for(state_path(config, name)):
+        data = updater(load_state(config, name, default))
+        save_state(config, name, data)
+        return data
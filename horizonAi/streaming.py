@@ -0,0 +1,126 @@
+import codecs
+import json
+import re
+
+_TOKEN = re.compile(r'["{}\[\]:]')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SEPARATORS = re.compile(r'[\s,]*')
+_DECODER = json.JSONDecoder()
+
+# A record that still fails to decode after this many characters is treated as invalid
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+
+
+class RecordStreamParser:
+    """
+    Incremental parser that extracts the elements of one array of a JSON document as
+    the bytes arrive, e.g. data.weaknesses_page.weaknesses of a GraphQL response.
+
+    Everything outside that array (the skeleton) is kept as text and parsed by close(),
+    with the array left empty, so page_info and errors are still available. Memory use
+    is bounded by the skeleton plus the record currently being decoded.
+    """
+
+    def __init__(self, path):
+        self.path = list(path)
+        self.count = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._mark = 0
+        self._skeleton = []
+        self._stack = []
+        self._last_string = None
+        self._in_records = False
+        self._retry_length = 0
+
+    def feed(self, chunk, final=False):
+        """
+        Feed raw bytes and return the records completed by them. The last call must pass
+        final=True to flush records still waiting for more data.
+        """
+        self._buffer += self._decoder.decode(chunk, final=final)
+        records = []
+        self._scan(records, final)
+        self._compact()
+        return records
+
+    def close(self):
+        """Return the skeleton document once all data was fed"""
+        if self._in_records or self._stack:
+            raise ValueError("Truncated JSON response")
+        self._skeleton.append(self._buffer[self._mark:])
+        return json.loads(''.join(self._skeleton))
+
+    def _keys(self):
+        return [key for _, key in self._stack]
+
+    def _scan_records(self, records, final):
+        """Decode complete records; returns False when more data is needed"""
+        buffer = self._buffer
+        while True:
+            self._pos = _SEPARATORS.match(buffer, self._pos).end()
+            if self._pos >= len(buffer):
+                return False
+            if buffer[self._pos] == ']':
+                # end of the record array, the skeleton resumes at the bracket
+                self._in_records = False
+                self._mark = self._pos
+                self._pos += 1
+                return True
+            pending = len(buffer) - self._pos
+            if pending < self._retry_length and not final:
+                return False
+            try:
+                record, end = _DECODER.raw_decode(buffer, self._pos)
+            except ValueError:
+                if final or pending > MAX_RECORD_SIZE:
+                    raise
+                # record continues in a later chunk; wait until the pending data doubled
+                # so a large record is not re-parsed for every chunk
+                self._retry_length = pending * 2
+                return False
+            self._retry_length = 0
+            records.append(record)
+            self.count += 1
+            self._pos = end
+
+    def _scan(self, records, final=False):
+        buffer = self._buffer
+        while True:
+            if self._in_records and not self._scan_records(records, final):
+                return
+            match = _TOKEN.search(buffer, self._pos)
+            if not match:
+                self._pos = len(buffer)
+                return
+            char, index = match.group(), match.start()
+            if char == '"':
+                string = _STRING.match(buffer, index)
+                if not string:
+                    # string continues in the next chunk
+                    self._pos = index
+                    return
+                self._pos = string.end()
+                self._last_string = string.group()
+                continue
+            self._pos = index + 1
+
+            if char == '[' and self._stack and self._keys() == self.path:
+                self._skeleton.append(buffer[self._mark:index + 1])
+                self._in_records = True
+            elif char in '{[':
+                self._stack.append([char, None])
+            elif char in '}]':
+                self._stack.pop()
+            elif char == ':' and self._stack and self._stack[-1][0] == '{':
+                self._stack[-1][1] = json.loads(self._last_string)
+
+    def _compact(self):
+        if not self._in_records:
+            self._skeleton.append(self._buffer[self._mark:self._pos])
+            self._mark = self._pos
+        cut = self._pos
+        self._buffer = self._buffer[cut:]
+        self._pos = 0
+        self._mark = max(self._mark - cut, 0)
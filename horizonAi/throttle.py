@@ -0,0 +1,142 @@
+import threading
+import time
+
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_RATE_BURST = 20
+DEFAULT_MAX_CONCURRENCY = 8
+# The concurrency window is multiplied by this factor when the server throttles
+DECREASE_FACTOR = 0.5
+# How often callers that cannot block (asyncio) check again for a free concurrency slot
+RETRY_POLL_INTERVAL = 0.005
+
+
+class RateLimiter:
+    """
+    Client-side limiter combining a token bucket (requests per second with a burst)
+    and an AIMD concurrency window.
+
+    The window is halved whenever the server throttles or fails a request and grows
+    back by roughly one slot per window of successful requests.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_RATE_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self._condition = threading.Condition()
+        self.tokens = None
+        self.window = None
+        self.configure(rate, burst, max_concurrency)
+        self._updated = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    def configure(self, rate, burst, max_concurrency):
+        with self._condition:
+            self.rate = max(float(rate), 0.0)
+            self.burst = max(int(burst), 1)
+            self.max_concurrency = max(int(max_concurrency), 1)
+            self.window = float(self.max_concurrency) if self.window is None \
+                else min(self.window, self.max_concurrency)
+            self.tokens = float(self.burst) if self.tokens is None else min(self.tokens, self.burst)
+            self._condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a token and a concurrency slot are available"""
+        started = time.monotonic()
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self.in_flight < max(int(self.window), 1) and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        self.requests += 1
+                        break
+                    timeout = (1 - self.tokens) / self.rate if self.tokens < 1 and self.rate else None
+                    self._condition.wait(timeout)
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - started
+            self.wait_time += waited
+        return waited
+
+    def try_acquire(self):
+        """
+        Take a token and a concurrency slot if both are available without waiting.
+        Returns None on success, otherwise the seconds to wait before trying again.
+        """
+        with self._condition:
+            self._refill()
+            if self.in_flight < max(int(self.window), 1) and self.tokens >= 1:
+                self.tokens -= 1
+                self.in_flight += 1
+                self.requests += 1
+                return None
+            if self.tokens < 1 and self.rate:
+                return (1 - self.tokens) / self.rate
+            # waiting for a concurrency slot
+            return RETRY_POLL_INTERVAL
+
+    def record_wait(self, waited):
+        with self._condition:
+            self.wait_time += waited
+
+    def release(self, throttled=False):
+        """Return a concurrency slot and adapt the window to the outcome of the request"""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.window = max(1.0, self.window * DECREASE_FACTOR)
+            else:
+                self.window = min(float(self.max_concurrency), self.window + 1 / self.window)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            self._refill()
+            return {
+                "rate_limit": self.rate,
+                "burst": self.burst,
+                "max_concurrency": self.max_concurrency,
+                "concurrency_window": round(self.window, 2),
+                "available_tokens": round(self.tokens, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "total_wait_s": round(self.wait_time, 3)
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(base_url, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_RATE_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Return the process-wide limiter for a server URL, applying the latest settings"""
+    with _limiters_lock:
+        limiter = _limiters.get(base_url)
+        if limiter is None:
+            limiter = _limiters[base_url] = RateLimiter(rate, burst, max_concurrency)
+            return limiter
+    if (limiter.rate, limiter.burst, limiter.max_concurrency) != (float(rate), int(burst), int(max_concurrency)):
+        limiter.configure(rate, burst, max_concurrency)
+    return limiter
+
+
+def limiter_stats():
+    """Stats of every limiter, keyed by server URL"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {base_url: limiter.stats() for base_url, limiter in limiters.items()}
@@ -0,0 +1,175 @@
+"""
+Offline benchmark of the connector operations against the local mock server.
+
+    python -m tests.benchmark --pentests 20 --weaknesses 20000 --iterations 5
+    python -m tests.benchmark --output run.json --compare previous_run.json
+
+Each scenario reports latency percentiles, record throughput and peak RSS, so hot path
+changes can be compared run over run. Scenarios run one at a time in a freshly spawned
+process whose peak RSS is reset before the first call, so it covers only that scenario's
+operation calls (on top of the interpreter and connector imports, which every scenario
+shares). The peak is read from VmHWM, as ru_maxrss of a spawned process on Linux starts
+at the peak of the parent holding the mock server; elsewhere ru_maxrss is used.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from horizonAi.horizon_api_auth import HorizonAPI
+from horizonAi.operations import operations
+from tests.mock_server import MockData, MockHorizonServer
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def reset_peak_rss():
+    """Restart the peak RSS of this process at its current RSS, where Linux allows it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def count_records(result):
+    count = 0
+    for key, value in (result or {}).items():
+        if isinstance(value, dict):
+            count += sum(len(v) for v in value.values() if isinstance(v, list))
+    return count
+
+
+def scenarios(data, page_size):
+    ops = [data.op_id(i) for i in range(data.pentests)]
+    return [
+        ('get_pentests', 'get_pentests', {"page_size": page_size}),
+        ('get_pentests_minimal', 'get_pentests', {"page_size": page_size, "fields": "minimal"}),
+        ('get_weaknesses_page', 'get_weaknesses', {"op_id": ops[0], "page_size": page_size, "bypass_cache": True}),
+        ('get_weaknesses_all', 'get_weaknesses',
+         {"op_id": ops[0], "page_size": page_size, "fetch_all": True, "bypass_cache": True}),
+        ('get_weaknesses_all_streamed', 'get_weaknesses',
+         {"op_id": ops[0], "page_size": page_size, "fetch_all": True, "stream_response": True, "bypass_cache": True}),
+        ('get_weaknesses_all_adaptive', 'get_weaknesses',
+         {"op_id": ops[0], "page_size": page_size, "fetch_all": True, "adaptive_page_size": True,
+          "max_page_size": 4096, "bypass_cache": True}),
+        ('get_weaknesses_all_minimal', 'get_weaknesses',
+         {"op_id": ops[0], "page_size": page_size, "fetch_all": True, "fields": "minimal", "bypass_cache": True}),
+        ('get_attack_paths_all', 'get_attack_paths',
+         {"op_id": ops[0], "page_size": page_size, "fetch_all": True, "bypass_cache": True}),
+        ('get_weaknesses_multi_op', 'get_weaknesses',
+         {"op_id": ops, "page_size": page_size, "fetch_all": True, "bypass_cache": True, "max_workers": 8}),
+        ('get_weaknesses_multi_op_page', 'get_weaknesses',
+         {"op_id": ops, "page_size": 50, "bypass_cache": True, "max_workers": 8}),
+        ('get_weaknesses_multi_op_batched', 'get_weaknesses',
+         {"op_id": ops, "page_size": 50, "bypass_cache": True, "max_workers": 8, "batch_requests": True}),
+    ]
+
+
+def run_scenario(config, operation, params, iterations):
+    """Run the iterations of one scenario in the current process; returns latencies, records and peak RSS"""
+    # authenticate before timing, as a warm connector would be
+    HorizonAPI(config)._auth_headers('benchmark')
+    reset_peak_rss()
+    latencies = []
+    records = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        result = operations[operation](config, dict(params))
+        latencies.append(time.perf_counter() - call_started)
+        records += count_records(result)
+        del result
+    return latencies, records, time.perf_counter() - started, peak_rss_mb()
+
+
+def run(args):
+    data = MockData(pentests=args.pentests, weaknesses_per_op=args.weaknesses,
+                    attack_paths_per_op=args.attack_paths, text_size=args.text_size)
+    results = {}
+    spawn = multiprocessing.get_context('spawn')
+    with MockHorizonServer(data, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate) as server:
+        config = server.config(rate_limit=0, max_concurrency=64)
+        operations['check_health'](config)
+        for name, operation, params in scenarios(data, args.page_size):
+            if args.only and name not in args.only:
+                continue
+            requests_before = server.counts['graphql']
+            with spawn.Pool(1) as pool:
+                latencies, records, elapsed, peak_rss = pool.apply(
+                    run_scenario, (config, operation, params, args.iterations))
+            results[name] = {
+                "iterations": args.iterations,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "records_per_s": round(records / elapsed, 1) if elapsed else 0.0,
+                "requests": server.counts['graphql'] - requests_before,
+                "peak_rss_mb": peak_rss
+            }
+    return results
+
+
+def print_report(results, previous=None):
+    header = f"{'scenario':32} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'rec/s':>12} {'reqs':>6} {'rss MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, row in results.items():
+        line = (f"{name:32} {row['p50_ms']:>10} {row['p90_ms']:>10} {row['p99_ms']:>10} "
+                f"{row['records_per_s']:>12} {row['requests']:>6} {row['peak_rss_mb']:>8}")
+        if previous and name in previous and previous[name]['p50_ms']:
+            change = (row['p50_ms'] - previous[name]['p50_ms']) / previous[name]['p50_ms'] * 100
+            line += f"  p50 {change:+.1f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pentests', type=int, default=10)
+    parser.add_argument('--weaknesses', type=int, default=5000, help='weaknesses per pentest')
+    parser.add_argument('--attack-paths', type=int, default=500, help='attack paths per pentest')
+    parser.add_argument('--text-size', type=int, default=2000, help='size of the markdown fields in characters')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='server latency per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/503')
+    parser.add_argument('--only', nargs='*', help='scenarios to run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
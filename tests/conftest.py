@@ -1,5 +1,7 @@
 import pytest
 
+from tests.mock_server import MockData, MockHorizonServer
+
 
 @pytest.fixture(autouse=True)
 def setup_test_env():
@@ -7,6 +9,14 @@ def setup_test_env():
     yield  # This is where the testing happens
 
 
+@pytest.fixture(scope='module')
+def mock_server():
+    """Local Horizon3.ai stand-in for tests that must not depend on the live API"""
+    data = MockData(pentests=6, weaknesses_per_op=120, attack_paths_per_op=30, text_size=200)
+    with MockHorizonServer(data) as server:
+        yield server
+
+
 def pytest_collection_modifyitems(items):
     """Add test categorization and metadata"""
     for item in items:
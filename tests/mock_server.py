@@ -0,0 +1,381 @@
+"""
+Local stand-in for the Horizon3.ai API used by the offline tests and the benchmark.
+
+Implements /v1/auth and /v1/graphql for pentests_page, attack_paths_page,
+weaknesses_page, pentest and hello with synthetic, deterministic data. Records are
+generated on demand from their index, so large datasets cost no memory up front.
+"""
+import base64
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VALID_API_KEY = 'mock-api-key'
+
+SEVERITIES = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'INFO')
+CATEGORIES = ('CREDENTIALS', 'MISCONFIGURATION', 'SECURITY_CONTROLS', 'VULNERABILITY')
+STATES = ('done', 'done', 'done', 'running', 'error')
+IMPACT_TYPES = ('DomainCompromise', 'SensitiveDataExposure', 'HostCompromise', 'CredentialCompromise')
+
+ROOT_FIELD = re.compile(r'(?:(\w+)\s*:\s*)?\b(pentests_page|attack_paths_page|weaknesses_page|pentest)\s*\(([^)]*)\)')
+ARGUMENT = re.compile(r'(\w+)\s*:\s*\$(\w+)')
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_jwt(ttl=3600):
+    """Unsigned JWT carrying an exp claim, enough for the connector's token cache"""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    return f"{encode({'alg': 'none'})}.{encode({'exp': int(time.time()) + ttl})}.signature"
+
+
+def _timestamp(offset_minutes):
+    return (EPOCH + timedelta(minutes=offset_minutes)).isoformat().replace('+00:00', 'Z')
+
+
+class MockData:
+    """Deterministic synthetic pentests, weaknesses and attack paths"""
+
+    def __init__(self, pentests=10, weaknesses_per_op=100, attack_paths_per_op=20, text_size=2000):
+        self.pentests = pentests
+        self.weaknesses_per_op = weaknesses_per_op
+        self.attack_paths_per_op = attack_paths_per_op
+        self.text_size = text_size
+
+    def op_id(self, index):
+        return f"op-{index:06d}"
+
+    def op_index(self, op_id):
+        try:
+            index = int(str(op_id).rsplit('-', 1)[1])
+        except (IndexError, ValueError):
+            return None
+        return index if 0 <= index < self.pentests else None
+
+    def pentest(self, index):
+        state = STATES[index % len(STATES)]
+        launched = index * 1440
+        return {
+            "op_id": self.op_id(index),
+            "op_type": "NodeZero",
+            "name": f"Pentest {index}",
+            "state": state,
+            "user_name": "mock@example.com",
+            "client_name": f"Client {index % 3}",
+            "min_scope": [f"10.{index % 256}.0.0/16"],
+            "max_scope": [f"10.{index % 256}.0.0/16"],
+            "exclude_scope": [],
+            "scheduled_at": _timestamp(launched - 10),
+            "launched_at": _timestamp(launched),
+            "completed_at": _timestamp(launched + 600) if state == 'done' else None,
+            "canceled_at": None,
+            "etl_completed_at": _timestamp(launched + 660) if state == 'done' else None,
+            "duration_s": 36000,
+            "impacts_count": index % 7,
+            "impact_paths_count": index % 11,
+            "attack_paths_count": self.attack_paths_per_op,
+            "phished_impact_paths_count": 0,
+            "phished_attack_paths_count": 0,
+            "weakness_types_count": min(self.weaknesses_per_op, 40),
+            "weaknesses_count": self.weaknesses_per_op,
+            "hosts_count": max(self.weaknesses_per_op // 5, 1),
+            "out_of_scope_hosts_count": 0,
+            "external_domains_count": 0,
+            "services_count": self.weaknesses_per_op // 2,
+            "credentials_count": self.weaknesses_per_op // 10,
+            "users_count": 10,
+            "cred_access_count": 1,
+            "data_stores_count": 2,
+            "websites_count": 3,
+            "data_resources_count": 4,
+            "nodezero_script_url": "https://example.com/nodezero.sh",
+            "nodezero_ip": "10.0.0.5"
+        }
+
+    def weakness(self, op_index, index):
+        op_id = self.op_id(op_index)
+        vuln = (index * 7 + op_index) % 500
+        host = index % max(self.weaknesses_per_op // 5, 1)
+        return {
+            "uuid": f"{op_id}-w{index:07d}",
+            "created_at": _timestamp(op_index * 1440 + index % 600),
+            "vuln_id": f"CVE-2024-{vuln:05d}",
+            "vuln_aliases": [f"H3-{vuln}"],
+            "vuln_category": CATEGORIES[vuln % len(CATEGORIES)],
+            "vuln_name": f"Mock vulnerability {vuln}",
+            "vuln_short_name": f"MV{vuln}",
+            "vuln_cisa_kev": vuln % 9 == 0,
+            "vuln_known_ransomware_campaign_use": vuln % 27 == 0,
+            "op_id": op_id,
+            "ip": f"10.{op_index % 256}.{host // 256}.{host % 256}",
+            "has_proof": index % 3 == 0,
+            "proof_failure_code": None,
+            "proof_failure_reason": None,
+            "score": round((vuln % 100) / 10, 1),
+            "severity": SEVERITIES[vuln % len(SEVERITIES)],
+            "base_score": round((vuln % 100) / 10, 1),
+            "base_severity": SEVERITIES[vuln % len(SEVERITIES)],
+            "context_score": round((vuln % 90) / 10, 1),
+            "context_severity": SEVERITIES[(vuln + 1) % len(SEVERITIES)],
+            "context_score_description_md": ("**Context** " * (self.text_size // 12 + 1))[:self.text_size],
+            "context_score_description": ("Context " * (self.text_size // 8 + 1))[:self.text_size],
+            "time_to_finding_hms": "00:10:00",
+            "time_to_finding_s": 600 + index,
+            "affected_asset_text": f"host-{host}.mock.local",
+            "downstream_impact_types": ["DomainCompromise"],
+            "downstream_impact_types_and_counts": [{"impact_type": "DomainCompromise", "count": vuln % 5}],
+            "impact_paths_count": vuln % 5,
+            "attack_paths_count": vuln % 3,
+            "diff_status": ("added", "unchanged", "removed")[index % 3],
+            "mitre_mappings": [{
+                "mitre_tactic_id": "TA0006",
+                "mitre_technique_id": f"T{1000 + vuln % 50}",
+                "mitre_subtechnique_id": None
+            }]
+        }
+
+    def attack_path(self, op_index, index):
+        op_id = self.op_id(op_index)
+        host = index % max(self.weaknesses_per_op // 5, 1)
+        weakness_refs = [f"{op_id}-w{(index * 3 + k) % max(self.weaknesses_per_op, 1):07d}" for k in range(3)]
+        return {
+            "uuid": f"{op_id}-ap{index:06d}",
+            "impact_type": IMPACT_TYPES[index % len(IMPACT_TYPES)],
+            "impact_title": f"Impact {index}",
+            "impact_description": f"Attack path {index} of {op_id}",
+            "name": f"Path {index}",
+            "attack_path_title": f"Path {index} title",
+            "base_score": 8.0,
+            "score": round(5 + (index % 50) / 10, 1),
+            "severity": SEVERITIES[index % len(SEVERITIES)],
+            "context_score_description_md": ("**Path** " * (self.text_size // 9 + 1))[:self.text_size],
+            "op_id": op_id,
+            "weakness_refs": weakness_refs,
+            "credential_refs": [f"{op_id}-cred{index % 10:04d}"],
+            "host_refs": [f"{op_id}-host{host:05d}"],
+            "time_to_finding_hms": "01:00:00",
+            "time_to_finding_s": 3600 + index,
+            "created_at": _timestamp(op_index * 1440 + index),
+            "target_entity_text": f"host-{host}.mock.local",
+            "affected_asset_text": f"host-{host}.mock.local",
+            "ip": f"10.{op_index % 256}.{host // 256}.{host % 256}",
+            "host_name": f"host-{host}.mock.local",
+            "host_text": f"host-{host}.mock.local"
+        }
+
+
+def _matches(record, filters):
+    for item in filters or []:
+        value = record.get(item.get('field_name'))
+        if 'values' in item:
+            values = item['values'] if isinstance(item['values'], list) else [item['values']]
+            if str(value) not in [str(v) for v in values]:
+                return False
+        if item.get('greater_than') and (value is None or str(value) <= str(item['greater_than'])):
+            return False
+        if item.get('less_than') and (value is None or str(value) >= str(item['less_than'])):
+            return False
+    return True
+
+
+def _project(record, tokens):
+    return {key: value for key, value in record.items() if key in tokens}
+
+
+class MockHorizonServer:
+    """
+    Threaded HTTP server emulating the Horizon3.ai API.
+
+    latency adds a fixed delay (plus up to jitter seconds) to every GraphQL response,
+    error_rate is the fraction of GraphQL requests answered with 503 / 429, requests
+    asking for pages larger than size_limit records are answered with 504, and page
+    sizes above page_cap are silently reduced to it (and echoed in page_info).
+    """
+
+    def __init__(self, data=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, host='127.0.0.1', port=0,
+                 size_limit=None, page_cap=None):
+        self.data = data or MockData()
+        self.size_limit = size_limit
+        self.page_cap = page_cap
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counts = {'auth': 0, 'graphql': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self, **overrides):
+        """Connector configuration pointing at this server"""
+        return dict({'server_url': self.url, 'api_token': VALID_API_KEY, 'verify_ssl': False}, **overrides)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-horizon', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _inject_error(self):
+        with self._lock:
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def _too_large(self, variables):
+        if not self.size_limit:
+            return False
+        sizes = [int((value or {}).get('page_size') or 50) for name, value in variables.items()
+                 if name.startswith('page_input')]
+        return any(size > self.size_limit for size in sizes)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send(400, {'message': 'invalid JSON'})
+                if self.path == '/v1/auth':
+                    server._count('auth')
+                    if request.get('key') != VALID_API_KEY:
+                        return self._send(401, {'message': 'invalid api key'})
+                    return self._send(200, {'token': make_jwt()})
+                if self.path == '/v1/graphql':
+                    server._count('graphql')
+                    if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+                        return self._send(401, {'message': 'missing token'})
+                    if server._inject_error():
+                        server._count('errors')
+                        status = server.random.choice((429, 503))
+                        return self._send(status, {'message': 'injected error'}, {'Retry-After': '0'})
+                    if server._too_large(request.get('variables') or {}):
+                        server._count('errors')
+                        return self._send(504, {'message': 'gateway timeout'})
+                    if server.latency or server.jitter:
+                        time.sleep(server.latency + server.random.uniform(0, server.jitter))
+                    return self._send(200, server.execute(request.get('query') or '', request.get('variables') or {}))
+                return self._send(404, {'message': 'not found'})
+
+        return Handler
+
+    def execute(self, query, variables):
+        """Resolve the root fields of a GraphQL document against the mock data"""
+        tokens = set(re.findall(r'\w+', query))
+        data = {}
+        errors = []
+        # skip the operation definition, whose variable list looks like arguments
+        roots = list(ROOT_FIELD.finditer(query, query.find('{') + 1))
+        if not roots and 'hello' in tokens:
+            return {'data': {'hello': 'world!'}}
+        for root in roots:
+            alias, field, arguments = root.group(1) or root.group(2), root.group(2), root.group(3)
+            args = {name: variables.get(var) for name, var in ARGUMENT.findall(arguments)}
+            try:
+                data[alias] = self._resolve(field, args, tokens)
+            except ValueError as e:
+                data[alias] = None
+                errors.append({'message': str(e), 'path': [alias]})
+        body = {'data': data}
+        if errors:
+            body['errors'] = errors
+        return body
+
+    def _page(self, records, page_input, tokens):
+        page_input = page_input or {}
+        page_num = max(int(page_input.get('page_num') or 1), 1)
+        page_size = max(int(page_input.get('page_size') or 50), 1)
+        if self.page_cap:
+            page_size = min(page_size, self.page_cap)
+        start = (page_num - 1) * page_size
+        page = [_project(record, tokens) for record in records(start, page_size)]
+        return page, {'page_size': page_size, 'end_cursor': str(start + len(page)) if page else None}
+
+    def _lazy(self, count, factory, page_input):
+        page_input = page_input or {}
+        filters = page_input.get('filter_by_inputs')
+        order_by = page_input.get('order_by')
+        if not filters and not order_by:
+            return lambda start, size: [factory(i) for i in range(start, min(start + size, count))]
+
+        def records(start, size):
+            matching = [record for record in (factory(i) for i in range(count)) if _matches(record, filters)]
+            if order_by:
+                matching.sort(key=lambda record: (record.get(order_by) is None, str(record.get(order_by))),
+                              reverse=page_input.get('sort_order') == 'DESC')
+            return matching[start:start + size]
+        return records
+
+    def _resolve(self, field, args, tokens):
+        data = self.data
+        if field == 'pentest':
+            index = data.op_index(args.get('op_id'))
+            if index is None:
+                raise ValueError(f"pentest {args.get('op_id')} not found")
+            return _project(data.pentest(index), tokens)
+
+        if field == 'pentests_page':
+            page_input = args.get('page_input')
+            pentests, page_info = self._page(self._lazy(data.pentests, data.pentest, page_input), page_input, tokens)
+            for pentest in pentests:
+                index = data.op_index(pentest['op_id'])
+                if 'attack_paths_page' in tokens:
+                    records, info = self._page(
+                        self._lazy(data.attack_paths_per_op, lambda i: data.attack_path(index, i), None), None, tokens)
+                    pentest['attack_paths_page'] = {'attack_paths': records, 'page_info': info}
+                if 'weaknesses_page' in tokens:
+                    records, info = self._page(
+                        self._lazy(data.weaknesses_per_op, lambda i: data.weakness(index, i), None), None, tokens)
+                    pentest['weaknesses_page'] = {'weaknesses': records, 'page_info': info}
+            return {'pentests': pentests, 'page_info': page_info}
+
+        index = data.op_index((args.get('input') or {}).get('op_id'))
+        if index is None:
+            raise ValueError(f"op_id {(args.get('input') or {}).get('op_id')} not found")
+        page_input = args.get('page_input')
+        if field == 'weaknesses_page':
+            records, page_info = self._page(
+                self._lazy(data.weaknesses_per_op, lambda i: data.weakness(index, i), page_input), page_input, tokens)
+            return {'weaknesses': records, 'page_info': page_info}
+        records, page_info = self._page(
+            self._lazy(data.attack_paths_per_op, lambda i: data.attack_path(index, i), page_input), page_input, tokens)
+        return {'attack_paths': records, 'page_info': page_info}
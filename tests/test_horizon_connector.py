@@ -1,6 +1,8 @@
 import pytest
 from connectors.core.connector import ConnectorError
+from horizonAi.horizon_api_auth import HorizonAPI, close_sessions, token_cache
 from horizonAi.operations import operations
+from horizonAi.queries import ENTITIES
 from tests.data import config, invalid_config
 
 
@@ -173,3 +175,117 @@ def test_pagination():
     # Verify pages are different
     if page1_pentests and page2_pentests:
         assert page1_pentests[0]['op_id'] != page2_pentests[0]['op_id']
+
+
+def test_token_cache_shared_across_instances():
+    """Test that separate HorizonAPI instances reuse one cached JWT"""
+    token_cache.clear()
+    first = HorizonAPI(config)._get_auth_token()
+    second = HorizonAPI(config)._get_auth_token()
+    assert first == second
+
+
+def test_session_pool_shared_per_config():
+    """Test that HorizonAPI instances for one config share a pooled session until it is closed"""
+    first = HorizonAPI(config)
+    assert first.session is HorizonAPI(config).session
+    close_sessions(config)
+    assert HorizonAPI(config).session is not first.session
+
+
+def test_get_weaknesses_fetch_all():
+    """Test following weakness pagination within a single call"""
+    get_pentests = operations.get('get_pentests')
+    pentests_resp = get_pentests(config, {"page_size": 1})
+    pentests = pentests_resp['pentests_page'].get('pentests', [])
+
+    if pentests:
+        op_id = pentests[0]['op_id']
+        get_weaknesses = operations.get('get_weaknesses')
+        params = {
+            "op_id": op_id,
+            "page_size": 5,
+            "fetch_all": True,
+            "max_records": 12
+        }
+        resp = get_weaknesses(config, params)
+        weaknesses = resp['weaknesses_page']['weaknesses']
+        assert len(weaknesses) <= 12
+        assert resp['weaknesses_page']['page_info']['total_count'] == len(weaknesses)
+
+
+def test_get_weaknesses_multiple_ops():
+    """Test querying weaknesses for several pentests in one call"""
+    get_pentests = operations.get('get_pentests')
+    pentests_resp = get_pentests(config, {"page_size": 3})
+    op_ids = [p['op_id'] for p in pentests_resp['pentests_page'].get('pentests', [])]
+
+    if op_ids:
+        get_weaknesses = operations.get('get_weaknesses')
+        resp = get_weaknesses(config, {"op_id": op_ids + ["invalid-op-id"], "page_size": 5, "max_workers": 2})
+        assert [r['op_id'] for r in resp['op_results']] == op_ids + ["invalid-op-id"]
+        assert resp['op_results'][-1]['status'] == 'failed'
+        assert 'weaknesses' in resp['weaknesses_page']
+
+
+def test_get_pentests_incremental(tmp_path):
+    """Test that a second incremental sync only returns pentests past the committed watermark"""
+    get_pentests = operations.get('get_pentests')
+    sync_config = dict(config, state_dir=str(tmp_path))
+    params = {"page_size": 50, "incremental": True}
+    first = get_pentests(sync_config, params)
+    if first['watermark']['current']:
+        operations.get('commit_pentest_watermark')(sync_config, {"watermark": first['watermark']['current']})
+    second = get_pentests(sync_config, params)
+    assert second['watermark']['previous'] == first['watermark']['current']
+    watermark = first['watermark']['current']
+    assert all(p['etl_completed_at'] > watermark for p in second['pentests_page']['pentests'])
+
+
+def test_get_pentests_minimal_fields():
+    """Test that a field preset limits the returned pentest fields"""
+    get_pentests = operations.get('get_pentests')
+    resp = get_pentests(config, {"page_size": 5, "fields": "minimal"})
+    pentests = resp['pentests_page'].get('pentests', [])
+    if pentests:
+        assert set(pentests[0]) == set(ENTITIES['pentests']['presets']['minimal'])
+
+
+def test_weaknesses_served_from_cache():
+    """Test that repeating a weaknesses query is answered by the response cache"""
+    get_pentests = operations.get('get_pentests')
+    pentests_resp = get_pentests(config, {"page_size": 1})
+    pentests = pentests_resp['pentests_page'].get('pentests', [])
+
+    if pentests:
+        get_weaknesses = operations.get('get_weaknesses')
+        get_cache_stats = operations.get('get_cache_stats')
+        params = {"op_id": pentests[0]['op_id'], "page_size": 5}
+        first = get_weaknesses(config, params)
+        hits = get_cache_stats(config, {})['hits']
+        second = get_weaknesses(config, params)
+        assert second == first
+        assert get_cache_stats(config, {})['hits'] == hits + 1
+
+
+def test_get_weaknesses_streamed():
+    """Test that a streamed weaknesses page matches the buffered one"""
+    get_pentests = operations.get('get_pentests')
+    pentests_resp = get_pentests(config, {"page_size": 1})
+    pentests = pentests_resp['pentests_page'].get('pentests', [])
+
+    if pentests:
+        get_weaknesses = operations.get('get_weaknesses')
+        params = {"op_id": pentests[0]['op_id'], "page_size": 10, "bypass_cache": True}
+        buffered = get_weaknesses(config, params)
+        streamed = get_weaknesses(config, dict(params, stream_response=True))
+        assert streamed['weaknesses_page']['weaknesses'] == buffered['weaknesses_page']['weaknesses']
+
+
+def test_get_rate_limit_status():
+    """Test that limiter state is reported for the configured server"""
+    operations.get('check_health')(config)
+    status = operations.get('get_rate_limit_status')(config, {})
+    assert status['requests'] >= 1
+    assert status['in_flight'] == 0
+    assert status['servers'][config['server_url'].rstrip('/')]['requests'] >= 1
@@ -0,0 +1,642 @@
+import asyncio
+import base64
+import gzip
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from connectors.core.connector import ConnectorError
+from horizonAi import operations as ops_module
+from horizonAi.async_client import AsyncHorizonAPI, async_available, run_sync
+from horizonAi.cache import ResponseCache, response_cache
+from horizonAi.diff import diff_findings
+from horizonAi.filters import plan_filters
+from horizonAi.horizon_api_auth import HorizonAPI, decode_jwt_exp
+from horizonAi.metrics import operation_context
+from horizonAi.models import Weakness
+from horizonAi.operations import operations, release_config, warm_up
+from horizonAi.paging import SIZE_ERROR, PageSizer
+from horizonAi.queries import op_page_query, resolve_fields
+from horizonAi.rollup import aggregate_weaknesses, summarize
+from horizonAi.streaming import RecordStreamParser
+from horizonAi.throttle import RateLimiter
+from tests.mock_server import MockData, MockHorizonServer
+
+
+def test_check_health_offline(mock_server):
+    """Test health check against the mock server"""
+    assert operations.get('check_health')(mock_server.config()) is True
+
+
+def test_failed_auth_offline(mock_server):
+    """Test behavior with an invalid API key"""
+    with pytest.raises(ConnectorError) as exc_info:
+        operations.get('check_health')(mock_server.config(api_token='wrong'))
+    assert "Authentication failed" in str(exc_info.value)
+
+
+def test_get_weaknesses_fetch_all_offline(mock_server):
+    """Test that fetch_all returns every weakness of an op"""
+    get_weaknesses = operations.get('get_weaknesses')
+    params = {"op_id": "op-000001", "page_size": 25, "fetch_all": True, "bypass_cache": True}
+    buffered = get_weaknesses(mock_server.config(), params)
+    streamed = get_weaknesses(mock_server.config(), dict(params, stream_response=True))
+    assert len(buffered['weaknesses_page']['weaknesses']) == 120
+    assert streamed['weaknesses_page']['weaknesses'] == buffered['weaknesses_page']['weaknesses']
+
+
+def test_get_attack_paths_multiple_ops_offline(mock_server):
+    """Test fan-out over several op_ids with one unknown op"""
+    resp = operations.get('get_attack_paths')(mock_server.config(), {
+        "op_id": "op-000000,op-000002,missing", "page_size": 10, "fetch_all": True, "bypass_cache": True
+    })
+    assert [r['status'] for r in resp['op_results']] == ['success', 'success', 'failed']
+    assert len(resp['attack_paths_page']['attack_paths']) == 60
+
+
+def test_get_pentests_incremental_offline(mock_server, tmp_path):
+    """Test that the watermark only advances once a run is committed"""
+    config = mock_server.config(state_dir=str(tmp_path))
+    get_pentests = operations.get('get_pentests')
+    commit = operations.get('commit_pentest_watermark')
+    with pytest.raises(ConnectorError):
+        commit(config, {})
+    # a page_num left in the parameters must not skip pentests past the watermark
+    first = get_pentests(config, {"incremental": True, "page_size": 2, "page_num": 2})
+    assert len(first['pentests_page']['pentests']) == 4
+    # not delivered yet, so the same pentests come again
+    retried = get_pentests(config, {"incremental": True, "page_size": 2})
+    assert retried['pentests_page']['pentests'] == first['pentests_page']['pentests']
+    committed = commit(config, {"watermark": retried['watermark']['current']})
+    assert committed['watermark'] == first['watermark']['current'] and committed['pending'] is None
+    second = get_pentests(config, {"incremental": True, "page_size": 2})
+    assert second['pentests_page']['pentests'] == []
+    assert second['watermark']['previous'] == first['watermark']['current']
+
+
+def test_retries_injected_errors_offline():
+    """Test that throttling and server errors are retried"""
+    with MockHorizonServer(MockData(pentests=2, weaknesses_per_op=40), error_rate=0.3, seed=1) as server:
+        resp = operations.get('get_weaknesses')(server.config(max_retries=10), {
+            "op_id": "op-000000", "page_size": 10, "fetch_all": True, "bypass_cache": True
+        })
+        assert len(resp['weaknesses_page']['weaknesses']) == 40
+        assert server.counts['errors'] > 0
+
+
+def test_get_connector_metrics_offline(mock_server):
+    """Test that requests are recorded per operation and exported"""
+    get_connector_metrics = operations.get('get_connector_metrics')
+    get_connector_metrics(mock_server.config(), {"reset": True})
+    with operation_context('get_weaknesses'):
+        operations.get('get_weaknesses')(mock_server.config(), {
+            "op_id": "op-000003", "page_size": 50, "fetch_all": True, "stream_response": True, "bypass_cache": True
+        })
+    snapshot = get_connector_metrics(mock_server.config(), {})
+    weaknesses = snapshot['operations']['get_weaknesses']['weaknesses_page']
+    assert weaknesses['latency_seconds']['count'] == 3
+    assert weaknesses['response_bytes']['sum'] > 0
+    prometheus = get_connector_metrics(mock_server.config(), {"format": "prometheus"})['prometheus']
+    assert 'horizon_request_latency_seconds_count{operation="get_weaknesses",graphql_operation="weaknesses_page"} 3' \
+        in prometheus
+
+
+def test_get_pentests_expand_nested_offline(mock_server):
+    """Test that nested weaknesses and attack paths are completed without refetching the first page"""
+    requests_before = mock_server.counts['graphql']
+    resp = operations.get('get_pentests')(mock_server.config(), {
+        "page_size": 2,
+        "fields": "minimal",
+        "include_attack_paths": True,
+        "include_weaknesses": True,
+        "weakness_fields": "minimal",
+        "attack_path_fields": "minimal",
+        "expand_nested": True
+    })
+    pentests = resp['pentests_page']['pentests']
+    assert len(pentests) == 2
+    for pentest in pentests:
+        weaknesses = pentest['weaknesses_page']['weaknesses']
+        assert len(weaknesses) == 120
+        assert len({w['uuid'] for w in weaknesses}) == 120
+        assert len(pentest['attack_paths_page']['attack_paths']) == 30
+    # one pentests page plus pages 2 and 3 of the weaknesses of both pentests
+    assert mock_server.counts['graphql'] - requests_before == 5
+
+
+def test_get_pentests_expand_nested_stale_count_offline():
+    """Test that nested pages are completed when the pentest's count is lower than the real total"""
+    class StaleCountData(MockData):
+        def pentest(self, index):
+            return dict(super().pentest(index), weaknesses_count=100)
+
+    with MockHorizonServer(StaleCountData(pentests=2, weaknesses_per_op=150, text_size=10)) as server:
+        resp = operations.get('get_pentests')(server.config(), {
+            "page_size": 2, "fields": "minimal", "include_weaknesses": True, "weakness_fields": "minimal",
+            "expand_nested": True
+        })
+        for pentest in resp['pentests_page']['pentests']:
+            weaknesses = pentest['weaknesses_page']['weaknesses']
+            assert len({w['uuid'] for w in weaknesses}) == len(weaknesses) == 150
+        assert 'expansion_errors' not in resp
+
+
+def test_get_weaknesses_batched_offline(mock_server):
+    """Test that batched queries return the same records in fewer requests"""
+    get_weaknesses = operations.get('get_weaknesses')
+    params = {"op_id": "op-000000,op-000001,missing,op-000002", "page_size": 20, "bypass_cache": True}
+    separate = get_weaknesses(mock_server.config(), params)
+    before = mock_server.counts['graphql']
+    batched = get_weaknesses(mock_server.config(), dict(params, batch_requests=True))
+    assert mock_server.counts['graphql'] - before == 1
+    assert batched['weaknesses_page']['weaknesses'] == separate['weaknesses_page']['weaknesses']
+    assert [r['status'] for r in batched['op_results']] == ['success', 'success', 'failed', 'success']
+
+    # a low cost limit splits the ops over several requests
+    before = mock_server.counts['graphql']
+    get_weaknesses(mock_server.config(), dict(params, batch_requests=True, max_batch_cost=20 * 30))
+    assert mock_server.counts['graphql'] - before > 1
+
+
+def test_identical_requests_coalesced_offline():
+    """Test that concurrent identical requests share one upstream call"""
+    query = op_page_query('weaknesses', resolve_fields('weaknesses', 'minimal'))
+    variables = {"input": {"op_id": "op-000001"}, "page_input": {"page_num": 1, "page_size": 10}}
+    with MockHorizonServer(MockData(pentests=2, weaknesses_per_op=20), latency=0.3) as server:
+        horizon = HorizonAPI(server.config())
+        horizon.check_health()
+        before = server.counts['graphql']
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: horizon.make_request(query, variables), range(5)))
+        assert server.counts['graphql'] - before == 1
+        assert all(result == results[0] for result in results)
+        assert len({id(result) for result in results}) == 5
+
+        # different variables are not coalesced
+        before = server.counts['graphql']
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda n: horizon.make_request(query, dict(variables, input={"op_id": n})),
+                              ["op-000000", "op-000001"]))
+        assert server.counts['graphql'] - before == 2
+
+
+def test_warm_up_and_release_offline():
+    """Test that warm-up prefetches op statuses and releasing a config drops its cache"""
+    with MockHorizonServer(MockData(pentests=3, weaknesses_per_op=10)) as server:
+        config = server.config(prefetch_pentests=True)
+        assert warm_up(config) == 3
+        assert server.counts['auth'] == 1
+        before = server.counts['graphql']
+        operations.get('get_weaknesses')(config, {"op_id": "op-000001", "page_size": 5})
+        # no status lookup is needed for a prefetched op
+        assert server.counts['graphql'] - before == 1
+
+        entries = response_cache.stats()['entries']
+        release_config(config)
+        assert response_cache.stats()['entries'] == entries - 4
+        operations.get('get_weaknesses')(config, {"op_id": "op-000001", "page_size": 5})
+        assert server.counts['auth'] == 2
+
+
+def test_get_weaknesses_filters_offline(mock_server):
+    """Test that pushed-down and local filters return exactly the matching weaknesses"""
+    get_weaknesses = operations.get('get_weaknesses')
+    base = {"op_id": "op-000001", "page_size": 25, "fetch_all": True, "bypass_cache": True}
+    everything = get_weaknesses(mock_server.config(), base)['weaknesses_page']['weaknesses']
+    expected = [w for w in everything if w['severity'] in ('CRITICAL', 'HIGH') and w['has_proof']
+                and w['score'] >= 2]
+
+    filters = {"severity": "CRITICAL,HIGH", "has_proof": "Yes", "min_score": 2}
+    before = mock_server.counts['graphql']
+    filtered = get_weaknesses(mock_server.config(), dict(base, **filters))['weaknesses_page']['weaknesses']
+    assert filtered == expected
+    # the severity filter is evaluated by the API, so fewer pages are transferred
+    assert mock_server.counts['graphql'] - before < 1 + len(everything) // 25
+
+    limited = get_weaknesses(mock_server.config(), dict(base, max_records=3, **filters))
+    assert limited['weaknesses_page']['weaknesses'] == expected[:3]
+
+    ordered = get_weaknesses(mock_server.config(), dict(base, order_by='time_to_finding_s', sort_order='DESC',
+                                                        fields='minimal'))['weaknesses_page']['weaknesses']
+    assert [w['time_to_finding_s'] for w in ordered] == sorted((w['time_to_finding_s'] for w in everything),
+                                                                reverse=True)
+
+
+def test_get_weaknesses_adaptive_page_size_offline():
+    """Test that adaptive paging returns every record in fewer requests and backs off on 504"""
+    data = MockData(pentests=2, weaknesses_per_op=700, text_size=50)
+    with MockHorizonServer(data, size_limit=128) as server:
+        get_weaknesses = operations.get('get_weaknesses')
+        params = {"op_id": "op-000001", "page_size": 50, "fetch_all": True, "bypass_cache": True}
+        fixed = get_weaknesses(server.config(), params)['weaknesses_page']['weaknesses']
+        for stream in (False, True):
+            before = server.counts['graphql']
+            adaptive = get_weaknesses(server.config(), dict(params, adaptive_page_size=True,
+                                                            stream_response=stream))
+            assert adaptive['weaknesses_page']['weaknesses'] == fixed
+            assert server.counts['graphql'] - before < 700 // 50
+
+
+def test_export_weaknesses_resume_offline(tmp_path, monkeypatch):
+    """Test that an interrupted export resumes from its checkpoint without duplicates"""
+    with MockHorizonServer(MockData(pentests=3, weaknesses_per_op=45)) as server:
+        config = server.config(state_dir=str(tmp_path))
+        params = {"page_size": 20, "fields": "minimal", "severity": "CRITICAL,HIGH,MEDIUM"}
+        make_request = HorizonAPI.make_request
+        calls = []
+
+        def failing(self, query, variables=None, *args, **kwargs):
+            calls.append(variables)
+            if len(calls) == 5:
+                raise ConnectorError("connection reset")
+            return make_request(self, query, variables, *args, **kwargs)
+
+        monkeypatch.setattr(HorizonAPI, 'make_request', failing)
+        with pytest.raises(ConnectorError):
+            operations.get('export_weaknesses')(config, params)
+        monkeypatch.setattr(HorizonAPI, 'make_request', make_request)
+
+        summary = operations.get('export_weaknesses')(config, params)
+        assert summary['complete'] and summary['resumed']
+        with gzip.open(summary['file_path'], 'rt') as f:
+            exported = [json.loads(line) for line in f]
+        expected = []
+        for op_id in ('op-000000', 'op-000001', 'op-000002'):
+            expected += operations.get('get_weaknesses')(config, dict(params, op_id=op_id, fetch_all=True))[
+                'weaknesses_page']['weaknesses']
+        assert exported == expected and summary['records'] == len(expected)
+
+        before = server.counts['graphql']
+        assert operations.get('export_weaknesses')(config, params) == summary
+        assert server.counts['graphql'] == before
+
+
+def test_export_weaknesses_under_server_page_cap_offline(tmp_path):
+    """Test that an export asking for more than the server serves per page still writes every record"""
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=450, text_size=10), page_cap=100) as server:
+        config = server.config(state_dir=str(tmp_path))
+        summary = operations.get('export_weaknesses')(config, {"page_size": 500, "fields": "minimal"})
+        with gzip.open(summary['file_path'], 'rt') as f:
+            exported = [json.loads(line) for line in f]
+        assert summary['complete'] and summary['records'] == len(exported) == 450
+        assert len({w['uuid'] for w in exported}) == 450
+
+
+def test_mirror_sync_and_lookups_offline(tmp_path):
+    """Test that the mirror syncs incrementally and answers lookups without API calls"""
+    with MockHorizonServer(MockData(pentests=5, weaknesses_per_op=30, attack_paths_per_op=6)) as server:
+        config = server.config(state_dir=str(tmp_path))
+        with pytest.raises(ConnectorError):
+            operations.get('lookup_ops_by_vuln')(config, {"vuln_id": "CVE-2024-00007"})
+
+        first = operations.get('sync_mirror')(config, {"page_size": 8})
+        assert first['errors'] == [] and first['synced_pentests'] > 0
+        assert first['mirror']['weaknesses'] == 30 * first['synced_pentests']
+        assert first['mirror']['attack_paths'] == 6 * first['synced_pentests']
+        again = operations.get('sync_mirror')(config, {})
+        assert again['synced_pentests'] == 0 and again['mirror'] == first['mirror']
+
+        weaknesses = operations.get('get_weaknesses')(config, {"op_id": "op-000000", "fetch_all": True,
+                                                                "page_size": 50})['weaknesses_page']['weaknesses']
+        ip = weaknesses[0]['ip']
+        before = server.counts['graphql']
+        found = operations.get('lookup_weaknesses_by_ip')(config, {"ip": ip})
+        assert found['count'] > 0 and all(w['ip'] == ip for w in found['weaknesses'])
+        assert {w['uuid'] for w in weaknesses if w['ip'] == ip} <= {w['uuid'] for w in found['weaknesses']}
+        ops = operations.get('lookup_ops_by_vuln')(config, {"vuln_id": weaknesses[0]['vuln_id']})
+        assert 'op-000000' in [op['op_id'] for op in ops['ops']]
+        assert server.counts['graphql'] == before
+
+
+@pytest.mark.parametrize('fetch_all', [False, True])
+def test_get_attack_paths_async_io_offline(mock_server, fetch_all):
+    """Test that the asyncio transport returns what the thread pool returns"""
+    get_attack_paths = operations.get('get_attack_paths')
+    params = {"op_id": "op-000000,missing,op-000002", "page_size": 10, "fetch_all": fetch_all,
+              "max_workers": 8, "bypass_cache": True}
+    threaded = get_attack_paths(mock_server.config(), params)
+    before = mock_server.counts['graphql']
+    concurrent = get_attack_paths(mock_server.config(), dict(params, async_io=True))
+    assert mock_server.counts['graphql'] - before == (9 if fetch_all else 3)
+    assert concurrent['attack_paths_page']['attack_paths'] == threaded['attack_paths_page']['attack_paths']
+    assert [r['status'] for r in concurrent['op_results']] == ['success', 'failed', 'success']
+    assert concurrent['async_transport'] == ('aiohttp' if async_available() else 'threads')
+
+
+def test_async_client_coalesces_and_follows_served_page_size_offline():
+    """Test that identical async requests share one call and paging follows a server page cap"""
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=250, text_size=10), page_cap=100) as server:
+        client = AsyncHorizonAPI(server.config())
+        query = op_page_query('weaknesses', resolve_fields('weaknesses', 'minimal'))
+        variables = {"input": {"op_id": "op-000000"}, "page_input": {"page_num": 1, "page_size": 500}}
+
+        async def run():
+            try:
+                pages = await asyncio.gather(client.make_request_async(query, variables),
+                                             client.make_request_async(query, variables))
+                records = [record async for record in client.paginate_async(query, variables, 'weaknesses_page',
+                                                                             'weaknesses')]
+            finally:
+                await client.aclose()
+            return pages, records
+
+        before = server.counts['graphql']
+        (first, second), records = run_sync(run())
+        assert first == second and first is not second
+        assert len({record['uuid'] for record in records}) == len(records) == 250
+        # one shared first page, then three pages of the capped size
+        assert server.counts['graphql'] - before == 4
+
+
+def test_get_weakness_summary_incremental_offline(tmp_path):
+    """Test that the rollup counts every weakness and reuses cached ops on rerun"""
+    with MockHorizonServer(MockData(pentests=6, weaknesses_per_op=40)) as server:
+        config = server.config(state_dir=str(tmp_path))
+        first = operations.get('get_weakness_summary')(config, {"page_size": 15, "top_n": 5})
+        assert first['pentests'] == 6 and first['weaknesses'] == 240
+        assert sum(first['by_severity'].values()) == 240 and len(first['by_vuln_id']) == 5
+        assert sum(bucket['weaknesses'] for bucket in first['trend']) == 240
+        assert first['rollup'] == {"cached_ops": 0, "fetched_ops": 6, "errors": []}
+
+        weaknesses = operations.get('get_weaknesses')(config, {"op_id": "op-000000", "fetch_all": True,
+                                                                "page_size": 50})['weaknesses_page']['weaknesses']
+        single = operations.get('get_weakness_summary')(config, {"op_id": "op-000000,missing"})
+        assert single['by_vuln_category'] == dict(Counter(w['vuln_category'] for w in weaknesses).most_common())
+        assert [error['op_id'] for error in single['rollup']['errors']] == ['missing']
+
+        second = operations.get('get_weakness_summary')(config, {"page_size": 15, "top_n": 5})
+        done = second['rollup']['cached_ops']
+        assert 0 < done < 6 and second['rollup']['fetched_ops'] == 6 - done
+        assert {k: v for k, v in second.items() if k != 'rollup'} == \
+            {k: v for k, v in first.items() if k != 'rollup'}
+
+
+def test_diff_pentests_offline(mock_server):
+    """Test that comparing pentests pairs findings by fingerprint"""
+    diff_pentests = operations.get('diff_pentests')
+    same = diff_pentests(mock_server.config(), {"baseline_op_id": "op-000000", "retest_op_id": "op-000000",
+                                                "page_size": 25})
+    assert same['weaknesses']['persisting_count'] == same['weaknesses']['baseline_count'] == 120
+    assert same['weaknesses']['new_count'] == same['weaknesses']['fixed_count'] == 0
+    assert same['attack_paths']['persisting_count'] == 30
+
+    # ops of the mock live on different subnets, so nothing carries over
+    other = diff_pentests(mock_server.config(), {"baseline_op_id": "op-000000", "retest_op_id": "op-000001",
+                                                 "include_attack_paths": False, "max_findings": 10})
+    assert 'attack_paths' not in other
+    assert (other['weaknesses']['fixed_count'], other['weaknesses']['new_count']) == (120, 120)
+    assert len(other['weaknesses']['new']) == 10 and other['weaknesses']['truncated']
+
+
+def test_get_attack_path_graph_offline():
+    """Test that shared references are resolved once in batched requests"""
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=500, attack_paths_per_op=300)) as server:
+        before = server.counts['graphql']
+        graph = operations.get('get_attack_path_graph')(server.config(), {"op_id": "op-000000", "page_size": 100})
+        requests = server.counts['graphql'] - before
+        paths = operations.get('get_attack_paths')(server.config(), {
+            "op_id": "op-000000", "fields": "triage", "fetch_all": True, "page_size": 100})['attack_paths_page']
+        refs = {ref for path in paths['attack_paths'] for ref in path['weakness_refs']}
+        assert graph['counts']['attack_paths'] == 300 and graph['counts']['weaknesses'] == len(refs)
+        assert set(graph['nodes']['weaknesses']) == refs and graph['unresolved']['weaknesses'] == []
+        # 3 full attack path pages, an empty last page and the weaknesses in chunks of 200
+        assert requests == 4 + -(-len(refs) // 200)
+        path = paths['attack_paths'][0]
+        assert graph['adjacency'][path['uuid']]['weaknesses'] == path['weakness_refs']
+        host = graph['nodes']['hosts'][path['host_refs'][0]]
+        assert host['ip'] == path['ip'] and 'weakness_refs' not in graph['attack_paths'][path['uuid']]
+
+
+def test_get_attack_path_graph_unfiltered_uuids_offline(monkeypatch):
+    """Test that a server ignoring the uuid filter falls back to one pass over the op's weaknesses"""
+    make_request = HorizonAPI.make_request
+
+    def ignore_uuid_filter(self, query, variables=None, *args, **kwargs):
+        page_input = (variables or {}).get('page_input') or {}
+        if any(item.get('field_name') == 'uuid' for item in page_input.get('filter_by_inputs') or ()):
+            variables = dict(variables, page_input=dict(page_input, filter_by_inputs=[]))
+        return make_request(self, query, variables, *args, **kwargs)
+
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=500, attack_paths_per_op=20)) as server:
+        params = {"op_id": "op-000000", "severity": "HIGH"}
+        expected = operations.get('get_attack_path_graph')(server.config(), params)
+        assert expected['weakness_lookup'] == 'uuid_filter'
+        monkeypatch.setattr(HorizonAPI, 'make_request', ignore_uuid_filter)
+        graph = operations.get('get_attack_path_graph')(server.config(), params)
+        assert graph['weakness_lookup'] == 'op_scan' and graph['unresolved']['weaknesses'] == []
+        assert graph['nodes'] == expected['nodes'] and graph['counts'] == expected['counts']
+
+
+def test_get_payload_profile_offline():
+    """Test that sampled responses are profiled per field path, buffered and streamed"""
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=60, text_size=400)) as server:
+        get_payload_profile = operations.get('get_payload_profile')
+        config = server.config(profile_payloads=True, profile_sample_rate=1)
+        get_payload_profile(config, {"reset": True})
+        params = {"op_id": "op-000000", "page_size": 60, "fields": "full", "bypass_cache": True}
+        operations.get('get_weaknesses')(config, params)
+        buffered = get_payload_profile(config, {"graphql_operation": "weaknesses_page"})
+        profile = buffered['operations']['weaknesses_page']
+        fields = {field['path']: field for field in profile['fields']}
+        assert buffered['sample_rate'] == 1 and profile['samples'] == 1
+        assert profile['fields'][0]['path'] == 'weaknesses_page'
+        assert 0.95 < fields['weaknesses_page']['byte_share'] <= 1.0
+        assert fields['weaknesses_page.weaknesses[].context_score_description_md']['byte_share'] > 0.2
+        assert fields['weaknesses_page.weaknesses[].proof_failure_reason']['null_rate'] == 1
+        assert fields['weaknesses_page.weaknesses[].mitre_mappings[].mitre_technique_id']['count'] == 60
+
+        get_payload_profile(config, {"reset": True})
+        operations.get('get_weaknesses')(config, dict(params, fetch_all=True, stream_response=True))
+        streamed = get_payload_profile(config, {"top_n": 3})['operations']['weaknesses_page']
+        assert streamed['samples'] == 2 and len(streamed['fields']) == 3
+        assert streamed['fields'][0]['path'] == 'weaknesses_page.weaknesses[]'
+
+        operations.get('get_weaknesses')(server.config(), params)
+        assert get_payload_profile(server.config(), {})['operations']['weaknesses_page']['samples'] == 2
+
+
+def test_size_errors_exclude_throttling():
+    """Test that only size and complexity errors shrink an adaptive page"""
+    for message in ("Response too large", "Query complexity 5000 exceeds the limit", "maximum page size is 100",
+                    "Request timed out"):
+        assert SIZE_ERROR.search(message)
+    for message in ("Rate limit exceeded", "Quota exceeded", "Too many requests", "Invalid payload"):
+        assert not SIZE_ERROR.search(message)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('adaptive,page_size', [(False, 500), (True, 500), (True, 50)])
+def test_fetch_all_under_server_page_cap_offline(stream, adaptive, page_size):
+    """Test that fetch_all follows the page size the server actually served"""
+    with MockHorizonServer(MockData(pentests=1, weaknesses_per_op=450, text_size=10), page_cap=100) as server:
+        weaknesses = operations.get('get_weaknesses')(server.config(), {
+            "op_id": "op-000000", "page_size": page_size, "fetch_all": True, "fields": "minimal",
+            "stream_response": stream, "adaptive_page_size": adaptive, "bypass_cache": True
+        })['weaknesses_page']['weaknesses']
+        assert [weakness['uuid'] for weakness in weaknesses] == [f"op-000000-w{i:07d}" for i in range(450)]
+
+
+def test_query_op_cache_bypass_and_status_failure_offline(mock_server, monkeypatch):
+    """Test that bypass_cache makes one request, and a failed status lookup keeps the data"""
+    get_weaknesses = operations.get('get_weaknesses')
+    params = {"op_id": "op-000003", "page_size": 7}
+    entries = response_cache.stats()['entries']
+    before = mock_server.counts['graphql']
+    get_weaknesses(mock_server.config(), dict(params, bypass_cache=True))
+    assert mock_server.counts['graphql'] - before == 1
+    assert response_cache.stats()['entries'] == entries
+
+    make_request = HorizonAPI.make_request
+
+    def failing_status(self, query, *args, **kwargs):
+        if query == ops_module.PENTEST_STATUS_QUERY:
+            raise ConnectorError("status lookup failed")
+        return make_request(self, query, *args, **kwargs)
+    monkeypatch.setattr(HorizonAPI, 'make_request', failing_status)
+    result = get_weaknesses(mock_server.config(), params)
+    assert len(result['weaknesses_page']['weaknesses']) == 7
+    assert response_cache.stats()['entries'] == entries + 1
+
+
+def test_response_cache_byte_budget():
+    """Test that the response cache evicts by size and skips entries over the budget"""
+    cache = ResponseCache(max_entries=10, max_bytes=100)
+    cache.set('a', 'x' * 40, 60)
+    cache.set('b', 'y' * 40, 60)
+    cache.set('c', 'z' * 40, 60)
+    assert cache.get('a') is None and cache.get('c') == 'z' * 40
+    assert cache.stats()['bytes'] <= 100
+    cache.set('big', 'w' * 200, 60)
+    assert cache.get('big') is None and cache.get('b') == 'y' * 40
+
+
+def test_decode_jwt_exp():
+    """Test reading the exp claim from a JWT"""
+    exp = int(time.time()) + 3600
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip('=')
+    assert decode_jwt_exp(f"header.{claims}.signature") == exp
+    assert decode_jwt_exp("not-a-jwt") is None
+
+
+def test_resolve_fields():
+    """Test resolving field selections to canonical field tuples"""
+    assert resolve_fields('weaknesses', 'severity, uuid') == ('uuid', 'severity')
+    assert resolve_fields('weaknesses', ['severity', 'uuid']) == resolve_fields('weaknesses', 'uuid,severity')
+    assert 'context_score_description_md' in resolve_fields('weaknesses')
+    with pytest.raises(ConnectorError):
+        resolve_fields('weaknesses', 'not_a_field')
+
+
+def test_record_stream_parser():
+    """Test extracting records from a response delivered in small chunks"""
+    records = [{"uuid": str(i), "vuln_name": 'quoted "]}" text', "mitre_mappings": [{"a": i}]} for i in range(25)]
+    body = json.dumps({
+        "data": {"weaknesses_page": {"weaknesses": records, "page_info": {"page_size": 25, "end_cursor": "x"}}},
+        "errors": [{"message": "weaknesses ["}]
+    }).encode()
+    parser = RecordStreamParser(['data', 'weaknesses_page', 'weaknesses'])
+    parsed = []
+    for i in range(0, len(body), 7):
+        parsed.extend(parser.feed(body[i:i + 7]))
+    parsed.extend(parser.feed(b'', final=True))
+    skeleton = parser.close()
+    assert parsed == records
+    assert skeleton['data']['weaknesses_page'] == {"weaknesses": [], "page_info": {"page_size": 25, "end_cursor": "x"}}
+    assert skeleton['errors'] == [{"message": "weaknesses ["}]
+
+
+def test_rate_limiter_aimd_window():
+    """Test that the concurrency window halves on throttling and recovers on success"""
+    limiter = RateLimiter(rate=0, burst=1, max_concurrency=8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.stats()['concurrency_window'] == 4
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.stats()['concurrency_window'] == 8
+    assert limiter.stats()['throttled'] == 1
+
+
+def test_plan_filters_split():
+    """Test that the filter planner pushes supported filters down and keeps the rest local"""
+    plan = plan_filters('weaknesses', {"severity": "CRITICAL, HIGH", "vuln_cisa_kev": "Yes", "has_proof": "Any",
+                                       "created_after": "2024-01-01", "order_by": "score", "sort_order": "DESC"})
+    assert plan.server_filters == [{"field_name": "severity", "values": ["CRITICAL", "HIGH"]},
+                                   {"field_name": "created_at", "greater_than": "2024-01-01"}]
+    assert plan.order_by == 'score' and plan.local_order is None
+    assert plan.fields == ('vuln_cisa_kev',)
+    records = [{"vuln_cisa_kev": True}, {"vuln_cisa_kev": False}, {}]
+    assert list(plan.apply(records)) == [records[0]]
+
+    plan = plan_filters('attack_paths', {"host_name": "DC01", "order_by": "name"})
+    assert plan.server_filters == [] and plan.local_order == ('name', False)
+    assert list(plan.apply([{"host_name": "dc01.corp"}, {"host_name": "web"}])) == [{"host_name": "dc01.corp"}]
+
+
+def test_page_sizer_alignment():
+    """Test that adaptive page sizes always address the next unread record"""
+    sizer = PageSizer(50, max_page_size=1000, target_bytes=1000, target_seconds=10)
+    assert (sizer.size, sizer.page_num) == (32, 1)
+    sizer.advance(100, 0.1)
+    # 32 records read, 64 would not divide the offset evenly
+    assert (sizer.size, sizer.offset) == (32, 32)
+    sizer.advance(100, 0.1)
+    assert (sizer.size, sizer.offset) == (64, 64)
+    sizer.advance(100, 0.1)
+    assert (sizer.size, sizer.offset) == (128, 128)
+    sizer.advance(5000, 0.1)
+    assert (sizer.size, sizer.offset) == (64, 256)
+    # 40 records of the failed page were read: two pages of 16 are skipped, 8 records dropped
+    assert sizer.shrink(40) == 8 and (sizer.size, sizer.offset) == (32, 256 + 32)
+    assert sizer.page_num == (256 + 32) // 32 + 1
+
+
+def test_weakness_model_round_trip():
+    """Test that compact models intern strings, keep heavy fields encoded and convert back"""
+    records = [{"uuid": f"w{i}", "op_id": "op-" + "1" * 8, "severity": "HIGH".lower().upper(),
+                "context_score_description_md": "**Context** " * 50, "mitre_mappings": [{"mitre_tactic_id": "TA0001"}],
+                "has_proof": i % 2 == 0} for i in range(3)]
+    models = [Weakness.from_dict(record) for record in records]
+    assert models[0].severity is models[1].severity is sys.intern("HIGH")
+    assert isinstance(models[0].raw('context_score_description_md'), bytes)
+    assert models[0].context_score_description_md == records[0]["context_score_description_md"]
+    assert [model.to_dict() for model in models] == records
+    assert models[0].get('vuln_id') is None and not hasattr(models[0], '__dict__')
+    assert [json.loads(model.to_json()) for model in models] == records
+
+
+def test_weakness_rollup_merge():
+    """Test that per-op aggregates merge into totals and trend buckets"""
+    weaknesses = [
+        {"vuln_id": "CVE-1", "severity": "HIGH", "vuln_category": "web", "vuln_cisa_kev": True,
+         "mitre_mappings": [{"mitre_technique_id": "T1003"}, {"mitre_technique_id": "T1110"}]},
+        {"vuln_id": "CVE-2", "severity": "LOW", "vuln_category": None, "vuln_cisa_kev": False, "mitre_mappings": None},
+    ]
+    aggregates = {"a": aggregate_weaknesses(weaknesses), "b": aggregate_weaknesses(weaknesses[:1])}
+    pentests = [{"op_id": "a", "launched_at": "2024-01-31T10:00:00Z"},
+                {"op_id": "b", "launched_at": "2024-02-01T10:00:00Z"}]
+    summary = summarize(aggregates, pentests, 'month', top_n=1)
+    assert summary['weaknesses'] == 3 and summary['by_vuln_id'] == {"CVE-1": 2}
+    assert summary['by_vuln_category'] == {"web": 2, "unknown": 1}
+    assert summary['by_vuln_cisa_kev'] == {"true": 2, "false": 1}
+    assert [(bucket['period'], bucket['weaknesses']) for bucket in summary['trend']] == [("2024-01", 2), ("2024-02", 1)]
+    assert summarize(aggregates, pentests, 'week')['trend'][0]['period'] == "2024-W05"
+
+
+def test_diff_findings_pairs_duplicates():
+    """Test that findings sharing a fingerprint are matched one to one"""
+    def weakness(uuid, vuln_id, ip, severity='HIGH'):
+        return {"uuid": uuid, "vuln_id": vuln_id, "ip": ip, "affected_asset_text": ip, "severity": severity}
+    baseline = [weakness('a1', 'CVE-1', '10.0.0.1'), weakness('a2', 'CVE-1', '10.0.0.1'),
+                weakness('a3', 'CVE-2', '10.0.0.2')]
+    retest = iter([weakness('b1', 'CVE-1', '10.0.0.1', 'LOW'), weakness('b2', 'CVE-3', '10.0.0.1')])
+    result = diff_findings('weaknesses', iter(baseline), retest)
+    assert (result['persisting_count'], result['new_count'], result['fixed_count']) == (1, 1, 2)
+    assert result['persisting'][0]['baseline_uuid'] == 'a1' and result['persisting'][0]['baseline_severity'] == 'HIGH'
+    assert result['persisting'][0]['severity'] == 'LOW'
+    assert sorted(finding['uuid'] for finding in result['fixed']) == ['a2', 'a3']
+    assert result['new'][0]['vuln_id'] == 'CVE-3' and not result['truncated']